@@ -0,0 +1,200 @@
+"""Load generator for the API handler, replaying a dashboard-like mix of requests.
+
+Starts benchmarks/local_api.py in a subprocess (or targets --url, e.g. a
+deployed stage) and runs --users virtual users for --duration seconds. Each
+user polls /files every --poll-interval seconds like the website does, and in
+between picks actions from --mix with exponential think times:
+
+- dashboard: GET / (the server-rendered dashboard)
+- plaintext: GET /plaintext/{name}, popular documents more often than others
+- batch:     GET /plaintext?names=... for --batch-size documents
+- upload:    POST /upload, multipart, sizes drawn from --upload-sizes
+
+Reports per route: requests, errors, throughput, latency percentiles, mean
+response size on the wire (gzip accepted, like a browser), and the peak RSS the
+local server reported after requests of that route along with the largest growth
+of it during one of them.
+
+    python benchmarks/bench_api_load.py [--users 20] [--duration 60] [--containers 4]
+    python benchmarks/bench_api_load.py --mix dashboard=1,plaintext=6,batch=2,upload=1 --think 0.2
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from urllib.parse import quote
+
+DEFAULT_MIX = 'dashboard=1,plaintext=4,batch=1,upload=1'
+DEFAULT_UPLOAD_SIZES = '20k=6,1m=3,5m=1'
+
+UNITS = {'k': 1024, 'm': 1024 * 1024}
+
+def parse_weights(text, value=str):
+    weights = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        weights[value(name.strip())] = float(weight or 1)
+    return weights
+
+def parse_size(text):
+    text = text.lower()
+    return int(float(text[:-1]) * UNITS[text[-1]]) if text[-1] in UNITS else int(text)
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, route, seconds, status, size, rss, growth):
+        with self.lock:
+            entry = self.routes.setdefault(route, {'latencies': [], 'errors': 0, 'bytes': 0, 'rss': 0, 'growth': 0})
+            entry['latencies'].append(seconds)
+            entry['bytes'] += size
+            entry['errors'] += status >= 400
+            entry['rss'] = max(entry['rss'], rss)
+            entry['growth'] = max(entry['growth'], growth)
+
+def percentile(sorted_values, share):
+    return sorted_values[min(int(len(sorted_values) * share), len(sorted_values) - 1)]
+
+class VirtualUser(threading.Thread):
+    def __init__(self, index, args, names, stats, deadline):
+        super().__init__(daemon=True)
+        self.rng = random.Random(index)
+        self.args = args
+        self.names = names
+        self.stats = stats
+        self.deadline = deadline
+        self.mix = parse_weights(args.mix)
+        self.upload_sizes = parse_weights(args.upload_sizes, parse_size)
+
+    def request(self, route, method, path, body=None, headers=None):
+        request = urllib.request.Request(
+            self.args.url + path,
+            data=body,
+            method=method,
+            headers={'Accept-Encoding': 'gzip', **(headers or {})}
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=60) as response:
+                data = response.read()
+                status = response.status
+                response_headers = response.headers
+        except urllib.error.HTTPError as e:
+            data = e.read()
+            status = e.code
+            response_headers = e.headers
+        except OSError:
+            data, status, response_headers = b'', 599, {}
+        self.stats.record(
+            route, time.perf_counter() - start, status, len(data),
+            int(response_headers.get('X-Local-RSS') or 0),
+            int(response_headers.get('X-Local-RSS-Growth') or 0)
+        )
+
+    def pick_name(self):
+        # Skewed towards the first documents, a few hot documents get most of the reads
+        return self.names[min(int(self.rng.paretovariate(1.2)) - 1, len(self.names) - 1)]
+
+    def run(self):
+        # Users do not poll in lockstep
+        next_poll = time.monotonic() + self.rng.uniform(0, self.args.poll_interval)
+        while time.monotonic() < self.deadline:
+            if time.monotonic() >= next_poll:
+                self.request('files', 'GET', '/files')
+                next_poll += self.args.poll_interval
+                continue
+
+            action = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+            if action == 'dashboard':
+                self.request('dashboard', 'GET', '/')
+            elif action == 'plaintext':
+                self.request('plaintext', 'GET', '/plaintext/' + quote(self.pick_name(), safe=''))
+            elif action == 'batch':
+                names = {self.pick_name() for _ in range(self.args.batch_size)}
+                self.request('batch', 'GET', '/plaintext?names=' + quote(','.join(names), safe=','))
+            elif action == 'upload':
+                size = self.rng.choices(list(self.upload_sizes), weights=list(self.upload_sizes.values()))[0]
+                boundary = uuid.uuid4().hex
+                body = (
+                    f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="loadtest/{uuid.uuid4().hex}.bin"\r\n'
+                    f'Content-Type: application/octet-stream\r\n\r\n'
+                ).encode() + os.urandom(size) + f'\r\n--{boundary}--\r\n'.encode()
+                self.request('upload', 'POST', '/upload', body, {'Content-Type': f'multipart/form-data; boundary={boundary}'})
+
+            think = self.rng.expovariate(1 / self.args.think) if self.args.think > 0 else 0
+            time.sleep(max(0, min(think, next_poll - time.monotonic(), self.deadline - time.monotonic())))
+
+def start_local_server(args):
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'local_api.py'),
+         '--port', '0', '--containers', str(args.containers), '--documents', str(args.documents)],
+        stdout=subprocess.PIPE,
+        text=True
+    )
+    ready = json.loads(server.stdout.readline())
+    return server, ready['url'], ready['documents']
+
+def report(stats, elapsed):
+    print(f"{'route':<10} {'requests':>8} {'errors':>6} {'req/s':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8} {'avg KB':>8} {'RSS MB':>7} {'growth MB':>9}")
+    total = 0
+    for route, entry in sorted(stats.routes.items()):
+        latencies = sorted(entry['latencies'])
+        count = len(latencies)
+        total += count
+        print(f"{route:<10} {count:>8} {entry['errors']:>6} {count / elapsed:>7.1f} "
+              f"{percentile(latencies, 0.5) * 1000:>8.1f} {percentile(latencies, 0.9) * 1000:>8.1f} "
+              f"{percentile(latencies, 0.99) * 1000:>8.1f} {latencies[-1] * 1000:>8.1f} "
+              f"{entry['bytes'] / count / 1024:>8.1f} {entry['rss'] / 1024 / 1024:>7.0f} {entry['growth'] / 1024 / 1024:>9.1f}")
+    print(f"total      {total:>8} {'':>6} {total / elapsed:>7.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--url', help='API to load instead of a local server, e.g. https://.../Prod')
+    parser.add_argument('--users', type=int, default=20, help='concurrent virtual users')
+    parser.add_argument('--duration', type=float, default=60, help='seconds')
+    parser.add_argument('--think', type=float, default=1.0, help='mean seconds between a user\'s actions')
+    parser.add_argument('--poll-interval', type=float, default=10, help='seconds between a user\'s /files polls')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='action weights')
+    parser.add_argument('--upload-sizes', default=DEFAULT_UPLOAD_SIZES, help='upload size weights')
+    parser.add_argument('--batch-size', type=int, default=10, help='documents per batch plaintext request')
+    parser.add_argument('--containers', type=int, default=4, help='local server: concurrent handler containers')
+    parser.add_argument('--documents', type=int, default=500, help='local server: seeded documents')
+    args = parser.parse_args()
+
+    server = None
+    if args.url:
+        args.url = args.url.rstrip('/')
+        with urllib.request.urlopen(args.url + '/files') as response:
+            names = [item['Name'] for item in json.loads(response.read())['files']]
+    else:
+        server, args.url, names = start_local_server(args)
+        print(f"local API at {args.url} with {len(names)} documents and {args.containers} containers")
+
+    if not names:
+        sys.exit('The API has no documents to read')
+
+    try:
+        stats = Stats()
+        start = time.monotonic()
+        users = [VirtualUser(index, args, names, stats, start + args.duration) for index in range(args.users)]
+        for user in users:
+            user.start()
+        for user in users:
+            user.join()
+        report(stats, time.monotonic() - start)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,121 @@
+"""Throughput benchmark for the corpus export writers in src/export_writer.py.
+
+Generates --documents synthetic DocumentTable items (Decimals and all, as the
+scan returns them), splits them into --segments like the parallel scan does and
+writes each segment in its own process, the way each segment runs in its own
+Lambda. Reports rows/s and MB/s per worker (from its CPU time), compression
+ratio and part count, and projects the time for a --target sized corpus per
+segment against the 900 s Lambda timeout. DynamoDB scan time cannot be measured locally; it is
+added from --scan-mb-per-second, an assumed per-segment read rate.
+
+    python benchmarks/bench_export.py [--documents 20000] [--segments 4] [--format jsonl|parquet|both]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import export_writer
+
+LAMBDA_TIMEOUT_SECONDS = 900
+
+def make_items(seed, count, words):
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10))) for _ in range(20000)]
+    items = []
+    for index in range(count):
+        length = max(1, int(rng.expovariate(1 / words)))
+        # Zipf-like word choice, real text compresses well because of it
+        text = ' '.join(vocabulary[min(int(rng.paretovariate(1.1)) - 1, len(vocabulary) - 1)] for _ in range(length))
+        items.append({
+            'Name': f'docs/{seed}/{index:07d}.pdf',
+            'Bucket': 'documents',
+            'FileType': 'pdf',
+            'MimeType': 'application/pdf',
+            'FileSize': Decimal(rng.randint(10000, 5000000)),
+            'TimeUploaded': '2026-01-01T00:00:00.000000Z',
+            'WordCount': Decimal(length),
+            'Summary': ', '.join(text.split()[:15]),
+            'Summarizer': 'local',
+            'Labels': ['Text', 'Document'] if index % 5 == 0 else None,
+            'Similarity': Decimal('0.93') if index % 50 == 0 else None,
+            'Plaintext': text
+        })
+    return items
+
+def run_segment(args):
+    segment, count, words, file_format, part_bytes = args
+    items = make_items(segment, count, words)
+    raw_bytes = sum(len(item['Plaintext']) + len(item['Summary']) + 200 for item in items)
+
+    # CPU time, so workers sharing a core (fewer cores than segments) are not penalized
+    parts = []
+    start = time.process_time()
+    writer = export_writer.create_writer(file_format, lambda data, rows: parts.append((len(data), rows)), part_bytes)
+    for item in items:
+        writer.write(export_writer.to_row(item))
+    writer.close()
+    elapsed = time.process_time() - start
+
+    assert sum(rows for _, rows in parts) == count
+    return elapsed, raw_bytes, sum(size for size, _ in parts), len(parts)
+
+def benchmark(file_format, args):
+    per_segment = args.documents // args.segments
+    tasks = [(segment, per_segment, args.words, file_format, args.part_mb * 1024 * 1024) for segment in range(args.segments)]
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.segments) as executor:
+        results = list(executor.map(run_segment, tasks))
+    wall = time.perf_counter() - start
+
+    worker_seconds = max(elapsed for elapsed, _, _, _ in results)
+    raw = sum(raw for _, raw, _, _ in results)
+    written = sum(size for _, _, size, _ in results)
+    parts = sum(count for _, _, _, count in results)
+    rows_per_second = per_segment / worker_seconds
+
+    print(f"{file_format}:")
+    print(f"  {per_segment * args.segments:,} documents in {args.segments} segments, {raw / 1024 / 1024:.0f} MB raw, "
+          f"{written / 1024 / 1024:.0f} MB written in {parts} parts ({raw / written:.1f}x compression)")
+    print(f"  per worker: {rows_per_second:,.0f} rows/s, {raw / args.segments / worker_seconds / 1024 / 1024:.1f} MB/s "
+          f"(wall {wall:.1f} s including generation)")
+
+    # Projection for the target corpus: writing plus reading the segment from DynamoDB
+    target_per_segment = args.target / args.target_segments
+    raw_per_document = raw / (per_segment * args.segments)
+    write_seconds = target_per_segment / rows_per_second
+    scan_seconds = target_per_segment * raw_per_document / (args.scan_mb_per_second * 1024 * 1024)
+    total = write_seconds + scan_seconds
+    verdict = 'fits' if total < LAMBDA_TIMEOUT_SECONDS else 'needs continuation invocations'
+    print(f"  {args.target:,} documents over {args.target_segments} segments: {target_per_segment:,.0f} per segment, "
+          f"~{write_seconds:.0f} s writing + ~{scan_seconds:.0f} s scanning = ~{total:.0f} s per segment, {verdict} "
+          f"within {LAMBDA_TIMEOUT_SECONDS} s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--documents', type=int, default=20000, help='synthetic documents to export')
+    parser.add_argument('--segments', type=int, default=min(4, os.cpu_count() or 1), help='parallel workers')
+    parser.add_argument('--words', type=int, default=800, help='mean words per document')
+    parser.add_argument('--format', choices=['jsonl', 'parquet', 'both'], default='both')
+    parser.add_argument('--part-mb', type=int, default=64, help='part size in MB')
+    parser.add_argument('--target', type=int, default=1000000, help='corpus size to project for')
+    parser.add_argument('--target-segments', type=int, default=16, help='segments to project for')
+    parser.add_argument('--scan-mb-per-second', type=float, default=10.0,
+                        help='assumed DynamoDB scan rate per segment, on-demand tables')
+    args = parser.parse_args()
+
+    formats = ['jsonl', 'parquet'] if args.format == 'both' else [args.format]
+    for file_format in formats:
+        if file_format == 'parquet' and not export_writer.parquet_available():
+            print("parquet: skipped, pyarrow is not installed")
+            continue
+        benchmark(file_format, args)
+
+if __name__ == '__main__':
+    main()
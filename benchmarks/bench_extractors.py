@@ -0,0 +1,156 @@
+"""Throughput benchmark for the text extractors in src/extractors.
+
+Builds a synthetic document of each format in memory and reports how fast
+each extractor turns it into text, plus the cold import time of the registry
+and of each extractor module.
+
+    python benchmarks/bench_extractors.py [--size-mb 5] [--repeat 3]
+"""
+import argparse
+import io
+import os
+import random
+import subprocess
+import sys
+import time
+import zipfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import extractors
+
+WORDS = ('document invoice total amount customer service report quarter revenue growth '
+         'contract payment delivery shipment order product analysis summary review').split()
+
+def sentences(size_bytes, seed=7):
+    """Yield random sentences until roughly size_bytes of text were produced"""
+    rng = random.Random(seed)
+    produced = 0
+    while produced < size_bytes:
+        sentence = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(6, 18))).capitalize() + '.'
+        produced += len(sentence) + 1
+        yield sentence
+
+def make_text(size):
+    return '\n'.join(sentences(size)).encode('utf-8')
+
+def make_markdown(size):
+    lines = []
+    for i, sentence in enumerate(sentences(size)):
+        lines.append(f'## Section {i}' if i % 20 == 0 else f'- **{sentence[:10]}**{sentence[10:]} [link](https://example.com/{i})')
+    return '\n'.join(lines).encode('utf-8')
+
+def make_html(size):
+    body = ''.join(f'<p class="x">{sentence}</p>\n' for sentence in sentences(size))
+    return f'<!DOCTYPE html><html><head><style>p{{}}</style></head><body>{body}</body></html>'.encode('utf-8')
+
+def make_zip(entries):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in entries:
+            # EPUB requires the mimetype entry first and uncompressed
+            archive.writestr(name, data, zipfile.ZIP_STORED if name == 'mimetype' else zipfile.ZIP_DEFLATED)
+    return buffer.getvalue()
+
+def make_docx(size):
+    ns = 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'
+    paragraphs = ''.join(f'<w:p><w:r><w:t>{sentence}</w:t></w:r></w:p>' for sentence in sentences(size))
+    return make_zip([('word/document.xml', f'<w:document xmlns:w="{ns}"><w:body>{paragraphs}</w:body></w:document>')])
+
+def make_xlsx(size):
+    ns = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+    shared = list(sentences(size // 2))
+    rows = ''.join(
+        f'<row r="{i + 1}"><c r="A{i + 1}" t="s"><v>{i}</v></c><c r="B{i + 1}"><v>{i * 1.5}</v></c></row>'
+        for i in range(len(shared))
+    )
+    strings = ''.join(f'<si><t>{sentence}</t></si>' for sentence in shared)
+    return make_zip([
+        ('xl/sharedStrings.xml', f'<sst xmlns="{ns}">{strings}</sst>'),
+        ('xl/worksheets/sheet1.xml', f'<worksheet xmlns="{ns}"><sheetData>{rows}</sheetData></worksheet>'),
+    ])
+
+def make_pptx(size):
+    ns = 'http://schemas.openxmlformats.org/drawingml/2006/main'
+    slides = []
+    batch = []
+    for sentence in sentences(size):
+        batch.append(f'<a:p><a:r><a:t>{sentence}</a:t></a:r></a:p>')
+        if len(batch) == 50:
+            slides.append(batch)
+            batch = []
+    slides.append(batch)
+    return make_zip([
+        (f'ppt/slides/slide{i + 1}.xml', f'<p:sld xmlns:p="urn:p" xmlns:a="{ns}"><p:txBody>{"".join(slide)}</p:txBody></p:sld>')
+        for i, slide in enumerate(slides)
+    ])
+
+def make_epub(size):
+    chapters = []
+    batch = []
+    for sentence in sentences(size):
+        batch.append(f'<p>{sentence}</p>')
+        if len(batch) == 500:
+            chapters.append(batch)
+            batch = []
+    chapters.append(batch)
+    manifest = ''.join(f'<item id="c{i}" href="text/c{i}.xhtml" media-type="application/xhtml+xml"/>' for i in range(len(chapters)))
+    spine = ''.join(f'<itemref idref="c{i}"/>' for i in range(len(chapters)))
+    entries = [
+        ('mimetype', 'application/epub+zip'),
+        ('META-INF/container.xml',
+         '<container xmlns="urn:oasis:names:tc:opendocument:xmlns:container"><rootfiles>'
+         '<rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>'),
+        ('OEBPS/content.opf',
+         f'<package xmlns="http://www.idpf.org/2007/opf"><manifest>{manifest}</manifest><spine>{spine}</spine></package>'),
+    ]
+    entries += [(f'OEBPS/text/c{i}.xhtml', f'<html><body>{"".join(chapter)}</body></html>') for i, chapter in enumerate(chapters)]
+    return make_zip(entries)
+
+BUILDERS = {
+    'text': make_text,
+    'markdown': make_markdown,
+    'html': make_html,
+    'docx': make_docx,
+    'xlsx': make_xlsx,
+    'pptx': make_pptx,
+    'epub': make_epub,
+}
+
+def import_time(statement):
+    """Seconds a fresh interpreter needs to run an import statement"""
+    root = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+    code = f'import time; start = time.perf_counter(); {statement}; print(time.perf_counter() - start)'
+    output = subprocess.run([sys.executable, '-c', code], cwd=root, capture_output=True, text=True, check=True)
+    return float(output.stdout)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=float, default=5, help='approximate amount of text per document')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per extractor, the best one is reported')
+    args = parser.parse_args()
+    size = int(args.size_mb * 1024 * 1024)
+
+    print(f"{'import':<10} {'ms':>8}")
+    print(f"{'registry':<10} {import_time('import src.extractors') * 1000:>8.1f}")
+    for file_format, target in extractors.EXTRACTORS.items():
+        module = target.split(':')[0]
+        print(f"{file_format:<10} {import_time(f'import src.extractors.{module}') * 1000:>8.1f}")
+    print()
+
+    print(f"{'format':<10} {'file MB':>8} {'text MB':>8} {'best s':>8} {'file MB/s':>10} {'text MB/s':>10}")
+    for file_format, build in BUILDERS.items():
+        content = build(size)
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            text = extractors.extract_text(file_format, io.BytesIO(content))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+
+        file_mb = len(content) / 1024 / 1024
+        text_mb = len(text.encode('utf-8')) / 1024 / 1024
+        print(f"{file_format:<10} {file_mb:>8.2f} {text_mb:>8.2f} {best:>8.3f} {file_mb / best:>10.1f} {text_mb / best:>10.1f}")
+
+if __name__ == '__main__':
+    main()
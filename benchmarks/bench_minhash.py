@@ -0,0 +1,125 @@
+"""Algorithm-only benchmark of the MinHash/LSH near-duplicate index in src/similarity.py.
+
+No DynamoDB is involved: the numbers are for signing, banding and comparing
+signatures, not for similarity.find_similar, whose latency is dominated by its
+32 Queries against SimilarityIndexTable and the batch_get_item of the candidates.
+
+Builds an in-memory stand-in for the band index with --signatures entries: a
+sorted array of 64-bit (band hash, document id) entries per band, holding what
+a Query per band returns from SimilarityIndexTable. Most entries are random
+filler; --queries synthetic documents are signed for real and planted in the
+index, then edited copies of them are looked up. Reports signing throughput,
+build time, index size, lookup latency, candidates per lookup and recall, and
+compares against a linear scan over all signatures.
+
+    python benchmarks/bench_minhash.py [--signatures 1000000] [--queries 200] [--edit-rate 0.05]
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from array import array
+from bisect import bisect_left
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from src import similarity
+
+def make_document(rng, vocabulary, words):
+    return ' '.join(rng.choice(vocabulary) for _ in range(words))
+
+def edit(rng, text, rate, vocabulary):
+    """Replace a share of the words, like OCR noise or a light revision"""
+    words = text.split()
+    for index in rng.sample(range(len(words)), int(len(words) * rate)):
+        words[index] = rng.choice(vocabulary)
+    return ' '.join(words)
+
+def build_index(count, planted, id_bits):
+    """Return one sorted array('Q') per band, planted maps document id -> band hashes"""
+    bands = []
+    for band in range(similarity.BANDS):
+        hashes = array('Q')
+        hashes.frombytes(os.urandom(8 * count))
+        entries = [(value >> id_bits << id_bits) | document for document, value in enumerate(hashes)]
+        for document, band_hashes in planted.items():
+            entries[document] = (band_hashes[band] >> id_bits << id_bits) | document
+        entries.sort()
+        bands.append(array('Q', entries))
+    return bands
+
+def lookup(bands, band_hashes, id_bits):
+    found = set()
+    for entries, value in zip(bands, band_hashes):
+        prefix = value >> id_bits
+        index = bisect_left(entries, prefix << id_bits)
+        while index < len(entries) and entries[index] >> id_bits == prefix:
+            found.add(entries[index] & ((1 << id_bits) - 1))
+            index += 1
+    return found
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--signatures', type=int, default=1000000, help='documents in the index')
+    parser.add_argument('--queries', type=int, default=200, help='near-duplicate lookups')
+    parser.add_argument('--words', type=int, default=2000, help='words per synthetic document')
+    parser.add_argument('--edit-rate', type=float, default=0.05, help='share of words changed in the near-duplicates')
+    parser.add_argument('--threshold', type=float, default=0.5, help='minimum similarity to count as found')
+    args = parser.parse_args()
+
+    rng = random.Random(7)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(3, 9))) for _ in range(5000)]
+    id_bits = max(args.signatures, args.queries).bit_length()
+
+    # Sign the planted documents and their edited copies
+    originals = [make_document(rng, vocabulary, args.words) for _ in range(args.queries)]
+    copies = [edit(rng, text, args.edit_rate, vocabulary) for text in originals]
+    start = time.perf_counter()
+    signatures = [similarity.signature(text) for text in originals]
+    elapsed = time.perf_counter() - start
+    print(f"signing:  {args.queries * args.words / elapsed:,.0f} words/s ({elapsed / args.queries * 1000:.1f} ms per {args.words} word document)")
+
+    query_signatures = [similarity.signature(text) for text in copies]
+    true_similarity = statistics.mean(similarity.similarity(a, b) for a, b in zip(signatures, query_signatures))
+    print(f"estimated similarity of the edited copies: {true_similarity:.2f}")
+
+    # Spread the planted documents over the id space
+    planted_ids = rng.sample(range(args.signatures), args.queries)
+    planted = {document: similarity.band_hashes(signature) for document, signature in zip(planted_ids, signatures)}
+    by_id = dict(zip(planted_ids, signatures))
+
+    start = time.perf_counter()
+    bands = build_index(args.signatures, planted, id_bits)
+    size_mb = sum(entries.buffer_info()[1] * entries.itemsize for entries in bands) / 1024 / 1024
+    print(f"index:    {args.signatures:,} signatures x {similarity.BANDS} bands built in {time.perf_counter() - start:.1f} s, {size_mb:.0f} MB")
+
+    latencies = []
+    candidate_counts = []
+    found = 0
+    for expected, query in zip(planted_ids, query_signatures):
+        start = time.perf_counter()
+        query_hashes = similarity.band_hashes(query)
+        candidates = lookup(bands, query_hashes, id_bits)
+        matches = [document for document in candidates
+                   if document in by_id and similarity.similarity(query, by_id[document]) >= args.threshold]
+        latencies.append(time.perf_counter() - start)
+        candidate_counts.append(len(candidates))
+        found += expected in matches
+
+    latencies.sort()
+    print(f"lookup (in memory):   p50 {latencies[len(latencies) // 2] * 1e6:.0f} us, p95 {latencies[int(len(latencies) * 0.95)] * 1e6:.0f} us, "
+          f"{statistics.mean(candidate_counts):.1f} candidates, recall {found / args.queries:.3f}")
+
+    # Linear scan: compare the query with every signature, timed on a sample
+    sample = [array('I', os.urandom(4 * similarity.PERMUTATIONS)) for _ in range(10000)]
+    start = time.perf_counter()
+    for other in sample:
+        similarity.similarity(query_signatures[0], other)
+    per_signature = (time.perf_counter() - start) / len(sample)
+    print(f"linear (in memory):   {per_signature * args.signatures:.1f} s per lookup over {args.signatures:,} signatures "
+          f"({per_signature * args.signatures / latencies[len(latencies) // 2]:,.0f}x slower)")
+
+if __name__ == '__main__':
+    main()
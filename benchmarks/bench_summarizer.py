@@ -0,0 +1,166 @@
+"""Quality and throughput benchmark for the local summarizer in src/summarizer.py.
+
+Summarizes every .txt/.md file of a corpus directory (the repository's own
+Markdown files when none is given), and SAMPLE_DOCUMENTS, and reports latency
+and words per second.
+
+Quality is measured as unigram overlap (ROUGE-1 F1) against a reference:
+a <name>.ref file next to the document when present, and with --comprehend
+the DetectKeyPhrases summary of the same text, which also times the
+Comprehend calls for comparison (needs AWS credentials, and costs money).
+
+    python benchmarks/bench_summarizer.py [--corpus DIR] [--repeat 3] [--comprehend]
+"""
+import argparse
+import glob
+import os
+import re
+import statistics
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from src import summarizer
+
+# (name, text, reference) documents added to every corpus. A README full of commands and
+# code, its summary should come from the prose around them
+SAMPLE_DOCUMENTS = [(
+    'sample-readme.md',
+    '''# Invoice Archive
+
+The invoice archive stores scanned supplier invoices and extracts the totals, due dates and
+supplier names from them. Finance teams search the archive by supplier and reconcile the
+invoices against purchase orders.
+
+## Deployment
+
+Install the dependencies and deploy the stack with the [SAM CLI](https://docs.aws.amazon.com/serverless-application-model/):
+
+```bash
+pip install -r requirements.txt
+sam build && sam deploy --guided --parameter-overrides RetentionDays=30
+export ARCHIVE_URL=$(aws cloudformation describe-stacks --stack-name invoice-archive --query 'Stacks[0].Outputs[0].OutputValue' --output text)
+```
+
+Upload an invoice with `curl -X PUT "$ARCHIVE_URL/invoices/inv-001.pdf" --data-binary @inv-001.pdf`, the
+archive extracts the invoice totals within a minute. Configuration lives in `config/archive.yaml`
+and the `ARCHIVE_RETENTION_DAYS` variable.
+
+## Reconciliation
+
+Every night the reconciliation job matches invoices to purchase orders by supplier, amount and
+date. Invoices without a matching purchase order are flagged for review, and the finance team
+gets a report of the flagged invoices. Matched invoices are archived after the retention period.
+
+```python
+def reconcile(invoice, orders):
+    return [order for order in orders if order.supplier_id == invoice.supplier_id]
+```
+
+See src/reconcile.py and tests/test_reconcile.py for the matching rules, or run
+python -m archive.reconcile --dry-run --since 2024-01-01 to preview a night's matches.
+''',
+    'invoice archive scanned supplier invoices totals due dates reconciliation purchase orders flagged review finance report'
+)]
+
+def load_corpus(directory):
+    """Return (name, text, reference or None) for each document of a directory"""
+    paths = sorted(glob.glob(os.path.join(directory, '*.txt')) + glob.glob(os.path.join(directory, '*.md')))
+    corpus = []
+    for path in paths:
+        with open(path, encoding='utf-8', errors='replace') as f:
+            text = f.read()
+        reference = None
+        reference_path = os.path.splitext(path)[0] + '.ref'
+        if os.path.exists(reference_path):
+            with open(reference_path, encoding='utf-8') as f:
+                reference = f.read()
+        if len(text.split()) > 25:
+            corpus.append((os.path.basename(path), text, reference))
+    return corpus
+
+def unigram_f1(candidate, reference):
+    candidate_words = set(re.findall(r'\w+', candidate.lower())) - summarizer.STOPWORDS
+    reference_words = set(re.findall(r'\w+', reference.lower())) - summarizer.STOPWORDS
+    overlap = len(candidate_words & reference_words)
+    if not overlap:
+        return 0.0
+    precision = overlap / len(candidate_words)
+    recall = overlap / len(reference_words)
+    return 2 * precision * recall / (precision + recall)
+
+def comprehend_summary(client, text):
+    """Summary the way lambda-comprehend-summarize.py builds it"""
+    text = text.encode('utf-8')[:100000].decode('utf-8', errors='ignore')
+    response = client.detect_key_phrases(Text=text, LanguageCode='en')
+    summary = ', '.join(phrase['Text'] for phrase in response['KeyPhrases'][:15])
+    return ' '.join(summary.split()[:15])
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--corpus', default=ROOT, help='directory of .txt/.md documents, optional <name>.ref references')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per document, the best one is reported')
+    parser.add_argument('--comprehend', action='store_true', help='also summarize with Amazon Comprehend')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) + SAMPLE_DOCUMENTS
+
+    client = None
+    if args.comprehend:
+        import boto3
+        client = boto3.client('comprehend')
+
+    local_times = []
+    comprehend_times = []
+    reference_scores = []
+    agreement_scores = []
+    total_words = 0
+
+    print(f"{'document':<30} {'words':>8} {'local ms':>9} {'ref F1':>7} {'cmp ms':>8} {'agree F1':>9}  summary")
+    for name, text, reference in corpus:
+        words = len(text.split())
+        total_words += words
+
+        best = None
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            summary = summarizer.summarize(text)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        local_times.append(best)
+
+        reference_score = ''
+        if reference is not None:
+            reference_scores.append(unigram_f1(summary, reference))
+            reference_score = f'{reference_scores[-1]:.2f}'
+
+        comprehend_ms = agreement = ''
+        if client:
+            start = time.perf_counter()
+            expected = comprehend_summary(client, text)
+            comprehend_times.append(time.perf_counter() - start)
+            agreement_scores.append(unigram_f1(summary, expected))
+            comprehend_ms = f'{comprehend_times[-1] * 1000:.0f}'
+            agreement = f'{agreement_scores[-1]:.2f}'
+
+        print(f"{name[:30]:<30} {words:>8} {best * 1000:>9.1f} {reference_score:>7} {comprehend_ms:>8} {agreement:>9}  {summary[:60]}")
+
+    print()
+    print(f"documents: {len(corpus)}, words: {total_words}")
+    print(f"local:      p50 {percentile(local_times, 0.5) * 1000:.1f} ms, p95 {percentile(local_times, 0.95) * 1000:.1f} ms, "
+          f"{total_words / sum(local_times):,.0f} words/s")
+    if comprehend_times:
+        print(f"comprehend: p50 {percentile(comprehend_times, 0.5) * 1000:.1f} ms, p95 {percentile(comprehend_times, 0.95) * 1000:.1f} ms, "
+              f"{total_words / sum(comprehend_times):,.0f} words/s")
+        print(f"agreement with Comprehend (ROUGE-1 F1): {statistics.mean(agreement_scores):.3f}")
+    if reference_scores:
+        print(f"reference ROUGE-1 F1: {statistics.mean(reference_scores):.3f} over {len(reference_scores)} documents")
+
+if __name__ == '__main__':
+    main()
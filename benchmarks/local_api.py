@@ -0,0 +1,228 @@
+"""Serve src/lambda-api-handler.py over HTTP locally, against in-memory S3 and DynamoDB.
+
+Each request is turned into an API Gateway REST proxy event (stage Prod, binary
+media types */*, so request bodies arrive base64 encoded) and the handler's
+response back into HTTP. AWS is replaced by moto's in-memory backends
+(pip install "moto[s3,dynamodb]"), with the stack's tables and buckets created
+and --documents synthetic documents seeded.
+
+Like Lambda, every container (a separately loaded copy of the handler module,
+with its own read cache) serves one request at a time; --containers sets how
+many there are. Responses carry X-Local-RSS, the server's resident memory after
+the request, and X-Local-RSS-Growth, how much it grew during the request (other
+requests running at the same time included), which bench_api_load.py reports
+per route.
+
+    python benchmarks/local_api.py [--port 8787] [--containers 4] [--documents 500]
+
+Routes that invoke other Lambdas (/bulk, /reprocess, /export) fail here, there
+are no functions behind them.
+"""
+import argparse
+import base64
+import importlib.util
+import json
+import os
+import queue
+import random
+import resource
+import sys
+import uuid
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+STAGE = 'Prod'
+BUCKET = 'local-documents'
+
+ENVIRONMENT = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'local',
+    'AWS_SECRET_ACCESS_KEY': 'local',
+    'dynamoDBTableName': 'local-documents',
+    'JOB_TABLE_NAME': 'local-jobs',
+    'SIMILARITY_INDEX_TABLE_NAME': 'local-similarity-index',
+    'BUCKET_NAME': BUCKET,
+    'DERIVATIVE_BUCKET_NAME': 'local-derivatives',
+    'EXPORT_BUCKET_NAME': 'local-exports',
+}
+
+def current_rss():
+    """Resident memory of this process in bytes"""
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # Peak instead of current where /proc is not available (ru_maxrss is bytes on macOS)
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss if sys.platform == 'darwin' else maxrss * 1024
+
+def create_resources(boto3):
+    dynamodb = boto3.resource('dynamodb')
+    dynamodb.create_table(
+        TableName=ENVIRONMENT['dynamoDBTableName'],
+        KeySchema=[{'AttributeName': 'Name', 'KeyType': 'HASH'}, {'AttributeName': 'Bucket', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'Name', 'AttributeType': 'S'}, {'AttributeName': 'Bucket', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.create_table(
+        TableName=ENVIRONMENT['JOB_TABLE_NAME'],
+        KeySchema=[{'AttributeName': 'JobId', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'JobId', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    dynamodb.create_table(
+        TableName=ENVIRONMENT['SIMILARITY_INDEX_TABLE_NAME'],
+        KeySchema=[{'AttributeName': 'Band', 'KeyType': 'HASH'}, {'AttributeName': 'Document', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': 'Band', 'AttributeType': 'S'}, {'AttributeName': 'Document', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST'
+    )
+    s3 = boto3.client('s3')
+    for bucket in (BUCKET, ENVIRONMENT['DERIVATIVE_BUCKET_NAME'], ENVIRONMENT['EXPORT_BUCKET_NAME']):
+        s3.create_bucket(Bucket=bucket)
+    return dynamodb.Table(ENVIRONMENT['dynamoDBTableName'])
+
+def seed_documents(table, count, seed=7):
+    """Processed documents with word counts spread like a real mix of notes, reports and books"""
+    rng = random.Random(seed)
+    vocabulary = [''.join(rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(rng.randint(2, 10))) for _ in range(5000)]
+    names = []
+    with table.batch_writer() as writer:
+        for index in range(count):
+            words = min(int(rng.lognormvariate(6, 1.5)), 60000)
+            text = ' '.join(rng.choice(vocabulary) for _ in range(words))
+            file_type = rng.choice(['pdf', 'pdf', 'png', 'docx', 'txt'])
+            name = f'documents/{index:05d}.{file_type}'
+            names.append(name)
+            item = {
+                'Name': name,
+                'Bucket': BUCKET,
+                'FileType': file_type,
+                'FileSize': rng.randint(2000, 20000000),
+                'TimeUploaded': f'2026-{rng.randint(1, 9):02d}-{rng.randint(1, 28):02d}T12:00:00.000000Z',
+                'Plaintext': text,
+                'WordCount': words,
+                'Summary': ', '.join(text.split()[:12]),
+                'Summarizer': 'local',
+                'ItemVersion': 1,
+            }
+            if index % 40 == 39:
+                item['DuplicateOf'] = names[index - 1]
+                item['Similarity'] = Decimal('0.95')
+            writer.put_item(Item=item)
+    return names
+
+def load_handler(quiet):
+    """A fresh copy of the handler module, i.e. one Lambda container"""
+    spec = importlib.util.spec_from_file_location(f'api_container_{uuid.uuid4().hex}', os.path.join(ROOT, 'src', 'lambda-api-handler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    if quiet:
+        # The handler logs every event, which would dominate the measurements
+        module.print = lambda *args, **kwargs: None
+    return module
+
+def to_event(method, raw_path, headers, body):
+    """The API Gateway REST proxy event for an HTTP request"""
+    url = urlsplit(raw_path)
+    path = url.path
+    # The dashboard calls the API under its stage name
+    if path.startswith(f'/{STAGE}/') or path == f'/{STAGE}':
+        path = path[len(STAGE) + 1:] or '/'
+
+    query = parse_qs(url.query, keep_blank_values=True)
+    return {
+        'resource': '/' if path == '/' else '/{proxy+}',
+        'path': path,
+        'httpMethod': method,
+        'headers': dict(headers),
+        'multiValueHeaders': {name: headers.get_all(name) for name in headers.keys()},
+        'queryStringParameters': {name: values[-1] for name, values in query.items()} or None,
+        'multiValueQueryStringParameters': query or None,
+        'pathParameters': {'proxy': path.lstrip('/')} if path != '/' else None,
+        'stageVariables': None,
+        'requestContext': {
+            'stage': STAGE,
+            'requestId': str(uuid.uuid4()),
+            'httpMethod': method,
+            'path': f'/{STAGE}{path}',
+            'resourcePath': '/' if path == '/' else '/{proxy+}',
+        },
+        # Binary media types */* make API Gateway base64 encode every request body
+        'body': base64.b64encode(body).decode('ascii') if body else None,
+        'isBase64Encoded': bool(body),
+    }
+
+def make_request_handler(containers):
+    class ProxyHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def handle_method(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            body = self.rfile.read(length) if length else b''
+            event = to_event(self.command, self.path, self.headers, body)
+
+            container = containers.get()
+            rss_before = current_rss()
+            try:
+                response = container.lambda_handler(event, None)
+            finally:
+                rss_after = current_rss()
+                containers.put(container)
+
+            data = response.get('body') or ''
+            data = base64.b64decode(data) if response.get('isBase64Encoded') else data.encode('utf-8')
+
+            self.send_response(response.get('statusCode', 200))
+            for name, value in (response.get('headers') or {}).items():
+                self.send_header(name, str(value))
+            self.send_header('Content-Length', str(len(data)))
+            self.send_header('X-Local-RSS', str(rss_after))
+            self.send_header('X-Local-RSS-Growth', str(max(rss_after - rss_before, 0)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        do_GET = do_POST = do_DELETE = do_OPTIONS = handle_method
+
+        def log_message(self, format, *args):
+            pass
+
+    return ProxyHandler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787, help='0 picks a free port')
+    parser.add_argument('--containers', type=int, default=4, help='handler copies serving requests concurrently')
+    parser.add_argument('--documents', type=int, default=500, help='synthetic documents to seed')
+    parser.add_argument('--verbose', action='store_true', help="keep the handler's own logging")
+    args = parser.parse_args()
+
+    os.environ.update(ENVIRONMENT)
+    try:
+        import boto3
+        from moto import mock_aws
+    except ImportError:
+        sys.exit('The local API needs boto3 and moto: pip install "moto[s3,dynamodb]"')
+
+    with mock_aws():
+        table = create_resources(boto3)
+        names = seed_documents(table, args.documents)
+
+        containers = queue.Queue()
+        for _ in range(args.containers):
+            containers.put(load_handler(quiet=not args.verbose))
+
+        server = ThreadingHTTPServer((args.host, args.port), make_request_handler(containers))
+        # bench_api_load.py reads this line to find the port and the seeded documents
+        print(json.dumps({'url': f'http://{args.host}:{server.server_address[1]}', 'documents': names}), flush=True)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""Writers for corpus exports: rows of DocumentTable items into compressed part files.
+
+A writer buffers rows and hands each finished part to a sink callable as
+sink(data, rows), so the same code writes to S3 in lambda-export-corpus and to
+memory in benchmarks/bench_export.py. Parts are closed at about part_bytes
+(compressed for JSONL, before compression for Parquet), which keeps a worker's
+memory bounded however large its share of the table is.
+
+Formats:
+- 'jsonl': one JSON object per line, gzip compressed
+- 'parquet': columnar, zstd compressed, needs pyarrow (via a layer)
+"""
+import gzip
+import io
+import json
+from decimal import Decimal
+
+# Exported attributes in column order, with the Parquet type of each
+COLUMNS = [
+    ('Name', 'string'),
+    ('Bucket', 'string'),
+    ('FileType', 'string'),
+    ('MimeType', 'string'),
+    ('TextEncoding', 'string'),
+    ('FileSize', 'int64'),
+    ('TimeUploaded', 'string'),
+    ('WordCount', 'int64'),
+    ('Summary', 'string'),
+    ('Summarizer', 'string'),
+    ('Labels', 'list<string>'),
+    ('DuplicateOf', 'string'),
+    ('Similarity', 'double'),
+    ('Plaintext', 'string'),
+]
+
+COLUMN_NAMES = [name for name, _ in COLUMNS]
+
+EXTENSIONS = {'jsonl': 'jsonl.gz', 'parquet': 'parquet'}
+
+# Parts are closed at about this size, see the module docstring
+PART_BYTES = 64 * 1024 * 1024
+
+def to_row(item, columns=COLUMN_NAMES):
+    """Turn a DynamoDB item into a plain row with the export columns, Decimals become numbers"""
+    row = {}
+    for column in columns:
+        value = item.get(column)
+        if isinstance(value, Decimal):
+            value = int(value) if value == value.to_integral_value() else float(value)
+        row[column] = value
+    return row
+
+def parquet_available():
+    try:
+        import pyarrow  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+def create_writer(file_format, sink, part_bytes=PART_BYTES, columns=COLUMN_NAMES):
+    if file_format == 'jsonl':
+        return JsonlWriter(sink, part_bytes)
+    if file_format == 'parquet':
+        if not parquet_available():
+            raise ValueError('Parquet exports need pyarrow, provide it with a layer (ExportLibraryLayerArn)')
+        return ParquetWriter(sink, part_bytes, columns)
+    raise ValueError(f'Unsupported export format: {file_format}')
+
+class JsonlWriter:
+    """Gzip compressed JSON Lines, compressed as the rows arrive"""
+
+    def __init__(self, sink, part_bytes=PART_BYTES, compresslevel=6):
+        self.sink = sink
+        self.part_bytes = part_bytes
+        self.compresslevel = compresslevel
+        self.rows = 0
+        self._open()
+
+    def _open(self):
+        self.buffer = io.BytesIO()
+        self.stream = gzip.GzipFile(fileobj=self.buffer, mode='wb', compresslevel=self.compresslevel, mtime=0)
+        self.rows = 0
+
+    def write(self, row):
+        self.stream.write(json.dumps(row, ensure_ascii=False, separators=(',', ':')).encode('utf-8'))
+        self.stream.write(b'\n')
+        self.rows += 1
+        # The buffer only grows as the compressor flushes blocks, good enough to cut parts
+        if self.buffer.tell() >= self.part_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        self.stream.close()
+        self.sink(self.buffer.getvalue(), self.rows)
+        self._open()
+
+    def close(self):
+        self.flush()
+
+class ParquetWriter:
+    """Parquet parts with one row group each, columns are collected in memory until about part_bytes of them"""
+
+    def __init__(self, sink, part_bytes=PART_BYTES, columns=COLUMN_NAMES):
+        import pyarrow as pa
+
+        self.pa = pa
+        self.sink = sink
+        self.part_bytes = part_bytes
+        types = dict(COLUMNS)
+        self.schema = pa.schema([(column, self._type(types.get(column, 'string'))) for column in columns])
+        self._open()
+
+    def _type(self, name):
+        pa = self.pa
+        return {
+            'string': pa.string(),
+            'int64': pa.int64(),
+            'double': pa.float64(),
+            'list<string>': pa.list_(pa.string()),
+        }[name]
+
+    def _open(self):
+        self.columns = {column: [] for column in self.schema.names}
+        self.rows = 0
+        self.size = 0
+
+    def write(self, row):
+        for column, values in self.columns.items():
+            values.append(row.get(column))
+        self.rows += 1
+        # Rough uncompressed size, the part ends up several times smaller
+        self.size += len(row.get('Plaintext') or '') + len(row.get('Summary') or '') + 256
+        if self.size >= self.part_bytes:
+            self.flush()
+
+    def flush(self):
+        if not self.rows:
+            return
+        import pyarrow.parquet as pq
+
+        table = self.pa.Table.from_pydict(self.columns, schema=self.schema)
+        buffer = io.BytesIO()
+        pq.write_table(table, buffer, compression='zstd', row_group_size=self.rows)
+        self.sink(buffer.getvalue(), self.rows)
+        self._open()
+
+    def close(self):
+        self.flush()
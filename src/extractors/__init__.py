@@ -0,0 +1,94 @@
+"""Registry of per-format text extractors.
+
+Formats are detected from the first bytes of the file (see sniff.py), or from
+the file extension when those are not available. Each format maps to a 'module:function'
+target inside this package that is only imported the first time a document of
+that format is seen, so plain text extraction never pays for the zip/XML/HTML
+parsers on a cold start.
+
+An extractor takes a binary file object (seekable for zip based formats) and
+yields text chunks. Text based extractors also take the sniffed encoding.
+"""
+import importlib
+
+# format -> 'module:function' inside this package
+EXTRACTORS = {
+    'text': 'plain:extract_text',
+    'markdown': 'markup:extract_markdown',
+    'html': 'markup:extract_html',
+    'docx': 'ooxml:extract_docx',
+    'xlsx': 'ooxml:extract_xlsx',
+    'pptx': 'ooxml:extract_pptx',
+    'epub': 'epub:extract_epub',
+}
+
+EXTENSIONS = {
+    'txt': 'text',
+    'csv': 'text',
+    'json': 'text',
+    'xml': 'text',
+    'log': 'text',
+    'md': 'markdown',
+    'markdown': 'markdown',
+    'html': 'html',
+    'htm': 'html',
+    'xhtml': 'html',
+    'docx': 'docx',
+    'xlsx': 'xlsx',
+    'pptx': 'pptx',
+    'epub': 'epub',
+}
+
+# Formats stored as zip archives, these need random access to the file
+ZIP_FORMATS = {'docx', 'xlsx', 'pptx', 'epub'}
+
+_loaded = {}
+
+def register(file_format, target, extensions=()):
+    """Register (or replace) the extractor for a format, e.g. register('rtf', 'rtf:extract_rtf', ['rtf'])"""
+    EXTRACTORS[file_format] = target
+    _loaded.pop(file_format, None)
+    for extension in extensions:
+        EXTENSIONS[extension.lower().lstrip('.')] = file_format
+
+def format_from_extension(key):
+    if '.' not in key:
+        return None
+    return EXTENSIONS.get(key.rsplit('.', 1)[1].lower())
+
+def detect_format(key, head=None):
+    """Return the format name for a file.
+
+    With the first bytes of the file (see sniff.SNIFF_BYTES) the content decides,
+    without them the extension does.
+    """
+    if head is None:
+        return format_from_extension(key)
+
+    from .sniff import sniff
+    return sniff(head, key)['format']
+
+def get_extractor(file_format):
+    """Return the extractor function for a format, importing its module on first use"""
+    if file_format not in _loaded:
+        module_name, function_name = EXTRACTORS[file_format].split(':')
+        module = importlib.import_module(f'{__name__}.{module_name}')
+        _loaded[file_format] = getattr(module, function_name)
+    return _loaded[file_format]
+
+def extract_text(file_format, fileobj, max_chars=None, encoding=None):
+    """Run the extractor for a format and join its output, stopping once max_chars is reached.
+
+    encoding is the sniffed text encoding; zip based formats carry their own and ignore it.
+    """
+    options = {'encoding': encoding} if encoding and file_format not in ZIP_FORMATS else {}
+    chunks = []
+    length = 0
+    for chunk in get_extractor(file_format)(fileobj, **options):
+        chunks.append(chunk)
+        length += len(chunk)
+        if max_chars is not None and length >= max_chars:
+            break
+
+    text = ''.join(chunks)
+    return text[:max_chars] if max_chars is not None else text
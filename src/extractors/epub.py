@@ -0,0 +1,30 @@
+"""EPUB books: the XHTML chapters in reading (spine) order."""
+import posixpath
+import urllib.parse
+import zipfile
+import xml.etree.ElementTree as ET
+
+from .markup import extract_html
+
+CONTAINER = '{urn:oasis:names:tc:opendocument:xmlns:container}'
+OPF = '{http://www.idpf.org/2007/opf}'
+
+def spine_documents(archive):
+    """Return the chapter file names of the book in reading order"""
+    container = ET.fromstring(archive.read('META-INF/container.xml'))
+    rootfile = container.find(f'.//{CONTAINER}rootfile').get('full-path')
+    package = ET.fromstring(archive.read(rootfile))
+
+    base = posixpath.dirname(rootfile)
+    manifest = {item.get('id'): item.get('href') for item in package.iter(OPF + 'item')}
+    return [
+        posixpath.normpath(posixpath.join(base, urllib.parse.unquote(manifest[itemref.get('idref')])))
+        for itemref in package.iter(OPF + 'itemref')
+        if itemref.get('idref') in manifest
+    ]
+
+def extract_epub(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        for name in spine_documents(archive):
+            with archive.open(name) as stream:
+                yield from extract_html(stream)
@@ -0,0 +1,106 @@
+"""HTML and Markdown, reduced to their readable text."""
+import codecs
+import re
+from html.parser import HTMLParser
+
+CHUNK_SIZE = 64 * 1024
+
+# Elements whose end starts a new line in the extracted text
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'br', 'dd', 'div', 'dl', 'dt', 'figcaption',
+    'footer', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'hr', 'li', 'main', 'nav', 'ol',
+    'p', 'pre', 'section', 'table', 'td', 'th', 'tr', 'ul'
+}
+
+# Elements whose content is never shown
+SKIP_TAGS = {'head', 'script', 'style', 'noscript', 'template', 'svg'}
+
+class TextCollector(HTMLParser):
+    """Collect the visible text of an HTML document as it is fed"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts = []
+        self.skip_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in SKIP_TAGS:
+            self.skip_depth += 1
+        elif tag == 'br':
+            self.parts.append('\n')
+
+    def handle_endtag(self, tag):
+        if tag in SKIP_TAGS:
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag in BLOCK_TAGS:
+            self.parts.append('\n')
+
+    def handle_data(self, data):
+        if not self.skip_depth:
+            self.parts.append(data)
+
+    def take(self):
+        """Return the text collected since the last call"""
+        text = ''.join(self.parts)
+        self.parts = []
+        return text
+
+def normalize_whitespace(text):
+    lines = (' '.join(line.split()) for line in text.split('\n'))
+    return '\n'.join(line for line in lines if line)
+
+def extract_html(fileobj, encoding='utf-8'):
+    collector = TextCollector()
+    # Decode and parse the document piece by piece instead of all at once
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        block = fileobj.read(CHUNK_SIZE)
+        collector.feed(decoder.decode(block, final=not block))
+        # Only emit complete lines so words are never cut in half
+        text = collector.take()
+        if not block:
+            collector.close()
+            text += collector.take()
+            if text.strip():
+                yield normalize_whitespace(text)
+            return
+
+        head, separator, tail = text.rpartition('\n')
+        if separator:
+            collector.parts.append(tail)
+            if head.strip():
+                yield normalize_whitespace(head) + '\n'
+        else:
+            collector.parts.append(text)
+
+MARKDOWN_PATTERNS = [
+    (re.compile(r'^```.*$', re.MULTILINE), ''),                     # code fence lines, keep the code
+    (re.compile(r'!\[([^\]]*)\]\([^)]*\)'), r'\1'),                 # images -> alt text
+    (re.compile(r'\[([^\]]*)\]\([^)]*\)'), r'\1'),                  # links -> link text
+    (re.compile(r'^\s{0,3}(#{1,6}|>+|[-*+]|\d+[.)])\s+', re.MULTILINE), ''),  # headings, quotes, list markers
+    (re.compile(r'^\s{0,3}([-*_]\s*){3,}$', re.MULTILINE), ''),     # horizontal rules
+    (re.compile(r'(\*\*|__|\*|_|~~|`)(?=\S)(.+?)(?<=\S)\1'), r'\2'), # emphasis and inline code
+    (re.compile(r'<[^>]+>'), ''),                                   # inline HTML
+]
+
+def extract_markdown(fileobj, encoding='utf-8'):
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    pending = ''
+    while True:
+        block = fileobj.read(CHUNK_SIZE)
+        pending += decoder.decode(block, final=not block)
+        # Markdown syntax is line based, so strip it one batch of whole lines at a time
+        if block:
+            if '\n' not in pending:
+                continue
+            lines, _, pending = pending.rpartition('\n')
+        else:
+            lines, pending = pending, ''
+
+        for pattern, replacement in MARKDOWN_PATTERNS:
+            lines = pattern.sub(replacement, lines)
+        if lines.strip():
+            yield lines + '\n'
+
+        if not block:
+            return
@@ -0,0 +1,84 @@
+"""Office Open XML documents (DOCX, XLSX, PPTX).
+
+The parts are streamed out of the zip and parsed with iterparse, clearing each
+element once it has been read, so memory stays flat for large documents.
+"""
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+S = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+A = '{http://schemas.openxmlformats.org/drawingml/2006/main}'
+
+def iter_paragraphs(stream, paragraph_tag, text_tag):
+    """Yield the text of each paragraph in an XML part, one paragraph at a time"""
+    parts = []
+    for event, element in ET.iterparse(stream, events=('end',)):
+        if element.tag == text_tag:
+            if element.text:
+                parts.append(element.text)
+        elif element.tag == paragraph_tag:
+            if parts:
+                yield ''.join(parts)
+                parts = []
+            element.clear()
+
+def numbered_parts(archive, pattern):
+    """Names of the zip entries matching pattern, ordered by the number in their name"""
+    regex = re.compile(pattern)
+    matches = [(int(match.group(1)), name) for name in archive.namelist() for match in [regex.fullmatch(name)] if match]
+    return [name for _, name in sorted(matches)]
+
+def extract_docx(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        with archive.open('word/document.xml') as stream:
+            for paragraph in iter_paragraphs(stream, W + 'p', W + 't'):
+                yield paragraph + '\n'
+
+def extract_pptx(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        for name in numbered_parts(archive, r'ppt/slides/slide(\d+)\.xml'):
+            with archive.open(name) as stream:
+                for paragraph in iter_paragraphs(stream, A + 'p', A + 't'):
+                    yield paragraph + '\n'
+
+def read_shared_strings(archive):
+    """Load the workbook's shared string table, which cells refer to by index"""
+    if 'xl/sharedStrings.xml' not in archive.namelist():
+        return []
+
+    strings = []
+    with archive.open('xl/sharedStrings.xml') as stream:
+        for event, element in ET.iterparse(stream, events=('end',)):
+            if element.tag == S + 'si':
+                # Rich text strings are split over several runs
+                strings.append(''.join(text.text or '' for text in element.iter(S + 't')))
+                element.clear()
+    return strings
+
+def extract_xlsx(fileobj):
+    with zipfile.ZipFile(fileobj) as archive:
+        shared_strings = read_shared_strings(archive)
+
+        for name in numbered_parts(archive, r'xl/worksheets/sheet(\d+)\.xml'):
+            with archive.open(name) as stream:
+                row = []
+                for event, element in ET.iterparse(stream, events=('end',)):
+                    if element.tag == S + 'c':
+                        cell_type = element.get('t')
+                        if cell_type == 'inlineStr':
+                            value = ''.join(text.text or '' for text in element.iter(S + 't'))
+                        else:
+                            value_element = element.find(S + 'v')
+                            value = value_element.text if value_element is not None and value_element.text else ''
+                            if cell_type == 's' and value:
+                                value = shared_strings[int(value)]
+                        if value:
+                            row.append(value)
+                    elif element.tag == S + 'row':
+                        # One line per row, cells separated by tabs
+                        if row:
+                            yield '\t'.join(row) + '\n'
+                            row = []
+                        element.clear()
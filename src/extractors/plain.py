@@ -0,0 +1,19 @@
+"""Plain text files (TXT, CSV, JSON, XML, LOG)."""
+import codecs
+
+from .sniff import detect_encoding
+
+CHUNK_SIZE = 64 * 1024
+
+def extract_text(fileobj, encoding=None):
+    block = fileobj.read(CHUNK_SIZE)
+    if encoding is None:
+        encoding = detect_encoding(block) or 'utf-8'
+
+    # Decode as the file streams in; undecodable bytes become U+FFFD instead of failing the file
+    decoder = codecs.getincrementaldecoder(encoding)(errors='replace')
+    while True:
+        yield decoder.decode(block, final=not block)
+        if not block:
+            return
+        block = fileobj.read(CHUNK_SIZE)
@@ -0,0 +1,180 @@
+"""Content sniffing: the real type and text encoding of a file from its first bytes.
+
+Only the first few KB are needed (see SNIFF_BYTES), so callers can use a
+ranged GET instead of downloading the whole object. The extension is only used
+to refine what the bytes say, e.g. to tell CSV from plain text, never to
+override them.
+"""
+import codecs
+
+SNIFF_BYTES = 4096
+
+# (magic bytes, offset, MIME type), checked in order
+SIGNATURES = [
+    (b'%PDF-', 0, 'application/pdf'),
+    (b'\x89PNG\r\n\x1a\n', 0, 'image/png'),
+    (b'\xff\xd8\xff', 0, 'image/jpeg'),
+    (b'II*\x00', 0, 'image/tiff'),
+    (b'MM\x00*', 0, 'image/tiff'),
+    (b'GIF87a', 0, 'image/gif'),
+    (b'GIF89a', 0, 'image/gif'),
+    (b'WEBP', 8, 'image/webp'),
+    (b'PK\x03\x04', 0, 'application/zip'),
+    (b'\x1f\x8b', 0, 'application/gzip'),
+    (b'BZh', 0, 'application/x-bzip2'),
+    (b'\xfd7zXZ\x00', 0, 'application/x-xz'),
+    (b'7z\xbc\xaf\x27\x1c', 0, 'application/x-7z-compressed'),
+    (b'Rar!\x1a\x07', 0, 'application/vnd.rar'),
+    (b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 0, 'application/x-ole-storage'),
+    (b'{\\rtf', 0, 'application/rtf'),
+    (b'\x7fELF', 0, 'application/x-executable'),
+    (b'ftyp', 4, 'video/mp4'),
+    (b'ID3', 0, 'audio/mpeg'),
+    (b'OggS', 0, 'audio/ogg'),
+    (b'fLaC', 0, 'audio/flac'),
+    (b'SQLite format 3\x00', 0, 'application/vnd.sqlite3'),
+]
+
+# Entry names that identify the kind of zip archive from its local file headers
+ZIP_MARKERS = [
+    (b'mimetypeapplication/epub+zip', 'application/epub+zip'),
+    (b'META-INF/container.xml', 'application/epub+zip'),
+    (b'word/', 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'),
+    (b'xl/', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    (b'ppt/', 'application/vnd.openxmlformats-officedocument.presentationml.presentation'),
+]
+
+# Zip based MIME types by extension, for archives whose markers lie beyond the sniffed bytes
+ZIP_EXTENSIONS = {
+    'epub': 'application/epub+zip',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+}
+
+# Text MIME types by extension, for text the bytes alone cannot classify
+TEXT_EXTENSIONS = {
+    'txt': 'text/plain',
+    'log': 'text/plain',
+    'csv': 'text/csv',
+    'tsv': 'text/tab-separated-values',
+    'json': 'application/json',
+    'xml': 'application/xml',
+    'md': 'text/markdown',
+    'markdown': 'text/markdown',
+    'html': 'text/html',
+    'htm': 'text/html',
+    'xhtml': 'text/html',
+}
+
+# Extractor format for each MIME type we can extract text from
+MIME_FORMATS = {
+    'text/plain': 'text',
+    'text/csv': 'text',
+    'text/tab-separated-values': 'text',
+    'application/json': 'text',
+    'application/xml': 'text',
+    'text/markdown': 'markdown',
+    'text/html': 'html',
+    'application/epub+zip': 'epub',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document': 'docx',
+    'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet': 'xlsx',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation': 'pptx',
+}
+
+# Byte order marks, longest first so UTF-32 LE is not taken for UTF-16 LE
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+# Control characters that are normal in text files
+TEXT_CONTROL_BYTES = set(b'\t\n\r\f\b\x1b')
+
+# Bytes cp1252 leaves undefined, text containing them is decoded as latin-1
+CP1252_UNDEFINED = set(b'\x81\x8d\x8f\x90\x9d')
+
+def extension_of(key):
+    return key.rsplit('.', 1)[1].lower() if '.' in key.rsplit('/', 1)[-1] else ''
+
+def detect_encoding(head):
+    """Return the codec name for text content, or None if the bytes look binary"""
+    if not head:
+        return 'utf-8'
+
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    # UTF-16 without a BOM: ASCII-range text leaves every other byte zero
+    sample = head[:len(head) - len(head) % 2]
+    if sample:
+        even_zeros = sample[0::2].count(0) / (len(sample) / 2)
+        odd_zeros = sample[1::2].count(0) / (len(sample) / 2)
+        if odd_zeros > 0.4 and even_zeros < 0.05:
+            return 'utf-16-le'
+        if even_zeros > 0.4 and odd_zeros < 0.05:
+            return 'utf-16-be'
+
+    # NUL bytes or lots of control characters only show up in binary data
+    if 0 in head:
+        return None
+    control = sum(1 for byte in head if byte < 0x20 and byte not in TEXT_CONTROL_BYTES)
+    if control / len(head) > 0.05:
+        return None
+
+    try:
+        # final=False so a multi-byte character cut off at the end of the sample is fine
+        codecs.getincrementaldecoder('utf-8')().decode(head, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+
+    return 'latin-1' if CP1252_UNDEFINED & set(head) else 'cp1252'
+
+def text_mime_type(head, encoding, extension):
+    """Classify decoded text, preferring what the content says over the extension"""
+    start = head[:1024].decode(encoding, errors='ignore').lstrip('\ufeff').lstrip().lower()
+    if start.startswith('<!doctype html') or start.startswith('<html'):
+        return 'text/html'
+    if extension in TEXT_EXTENSIONS:
+        return TEXT_EXTENSIONS[extension]
+    if start.startswith('<?xml'):
+        return 'application/xml'
+    return 'text/plain'
+
+def sniff(head, key=''):
+    """Describe a file from its first bytes.
+
+    Returns a dict with the detected 'mimeType', the text 'encoding' (None for
+    binary content) and the extractor 'format' (None when no extractor handles it).
+    """
+    extension = extension_of(key)
+
+    mime_type = None
+    for magic, offset, candidate in SIGNATURES:
+        if head[offset:offset + len(magic)] == magic:
+            mime_type = candidate
+            break
+
+    if mime_type == 'application/zip':
+        for marker, candidate in ZIP_MARKERS:
+            if marker in head:
+                mime_type = candidate
+                break
+        else:
+            mime_type = ZIP_EXTENSIONS.get(extension, mime_type)
+
+    encoding = None
+    if mime_type is None:
+        encoding = detect_encoding(head)
+        mime_type = text_mime_type(head, encoding, extension) if encoding else 'application/octet-stream'
+
+    return {
+        'mimeType': mime_type,
+        'encoding': encoding,
+        'format': MIME_FORMATS.get(mime_type)
+    }
@@ -1,13 +1,56 @@
 import json
 import boto3
 import base64
+import gzip
 import os
+import time
+import uuid
+from datetime import datetime, timedelta
 from decimal import Decimal
 
+from src import lanes, pipeline, profiling, read_cache, similarity
+
 s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+index_table = dynamodb.Table(os.environ.get('SIMILARITY_INDEX_TABLE_NAME'))
+
+# Warm containers keep documents and listing pages between requests
+cache = read_cache.ReadCache(int(os.environ.get('READ_CACHE_MAX_BYTES', str(64 * 1024 * 1024))))
+
+# Documents are revalidated against their ItemVersion after this, listing pages are scanned again
+ITEM_CACHE_TTL_SECONDS = float(os.environ.get('ITEM_CACHE_TTL_SECONDS', '30'))
+LISTING_CACHE_TTL_SECONDS = float(os.environ.get('LISTING_CACHE_TTL_SECONDS', '5'))
+
+# Cached listing pages leave these out, /plaintext serves the text per document
+LISTING_OMITTED = ('Plaintext', 'MinHash')
+
+# /thumbnail/{name} redirects to a URL presigned for THUMBNAIL_URL_SECONDS, and browsers
+# keep the redirect for THUMBNAIL_CACHE_SECONDS, so a cached redirect never points at an
+# expired URL and polling the listing does not load the thumbnails again
+THUMBNAIL_URL_SECONDS = 3600
+THUMBNAIL_CACHE_SECONDS = 3000
 
+# Responses smaller than this are sent as they are, compressing them gains nothing
+MIN_COMPRESS_BYTES = 1024
+
+# Batch plaintext requests: keys per batch_get_item, names per request, and the bytes of
+# encoded JSON per response (Lambda responses are limited to 6MB, the rest leaves room
+# for base64 when compression gains little), the rest is returned as 'remaining'
+DYNAMODB_READ_BATCH = 100
+MAX_BATCH_NAMES = 100
+MAX_BATCH_TEXT_BYTES = 4 * 1024 * 1024
+MAX_RETRIES = 8
+
+try:
+    # Brotli is optional, provided by a layer
+    import brotli
+except ImportError:
+    brotli = None
+
+@profiling.profiled
 def lambda_handler(event, context):
     print(f"Lambda invoked with event: {json.dumps(event)}")
     
@@ -25,6 +68,9 @@ def lambda_handler(event, context):
     if method == 'OPTIONS':
         return {'statusCode': 200, 'headers': headers}
     
+    return compress_response(event, route(event, method, path, headers))
+
+def route(event, method, path, headers):
     try:
         if method == 'GET' and path == '/':
             print("Serving dashboard")
@@ -37,7 +83,7 @@ def lambda_handler(event, context):
             return handle_upload(event, headers)
         elif method == 'GET' and path == '/files':
             print("Getting files")
-            return handle_get_files(headers)
+            return handle_get_files(event, headers)
         elif method == 'POST' and path == '/presigned-url':
             print("Getting presigned URL")
             return get_presigned_url(event, headers)
@@ -47,9 +93,33 @@ def lambda_handler(event, context):
         elif method == 'GET' and '/download/' in path:
             print("Downloading file")
             return handle_download(event, headers)
+        elif method == 'GET' and '/thumbnail/' in path:
+            print("Getting thumbnail")
+            return handle_thumbnail(event, headers)
+        elif method in ('GET', 'POST') and path == '/plaintext':
+            print("Getting plaintext in batch")
+            return handle_get_plaintext_batch(event, headers)
         elif method == 'GET' and '/plaintext/' in path:
             print("Getting plaintext")
             return handle_get_plaintext(event, headers)
+        elif method == 'POST' and path == '/bulk':
+            print("Starting bulk operation")
+            return handle_bulk(event, headers)
+        elif method == 'POST' and path == '/export':
+            print("Starting export job")
+            return handle_export(event, headers)
+        elif method == 'POST' and path == '/reprocess':
+            print("Starting reprocess job")
+            return handle_reprocess(event, headers)
+        elif method == 'GET' and '/jobs/' in path:
+            print("Getting job status")
+            return handle_get_job(event, headers)
+        elif method == 'GET' and path == '/cache/stats':
+            print("Getting cache stats")
+            return {'statusCode': 200, 'headers': headers, 'body': json.dumps(cache.stats())}
+        elif method == 'GET' and '/similar/' in path:
+            print("Finding similar files")
+            return handle_get_similar(event, headers)
         else:
             print(f"No route found for {method} {path}")
             print(f"Full event: {json.dumps(event)}")
@@ -74,6 +144,55 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def compress_response(event, response):
+    """Compress a text response body with the best encoding the client accepts"""
+    body = response.get('body')
+    if not isinstance(body, str) or response.get('isBase64Encoded') or len(body) < MIN_COMPRESS_BYTES:
+        return response
+    
+    request_headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
+    encoding = negotiate_encoding(request_headers.get('accept-encoding', ''))
+    if not encoding:
+        return response
+    
+    data = body.encode('utf-8')
+    # Fast settings, the Lambda pays for the compression time on every request
+    compressed = brotli.compress(data, quality=4) if encoding == 'br' else gzip.compress(data, compresslevel=5)
+    return {
+        **response,
+        'headers': {**response.get('headers', {}), 'Content-Encoding': encoding, 'Vary': 'Accept-Encoding'},
+        'body': base64.b64encode(compressed).decode('ascii'),
+        'isBase64Encoded': True
+    }
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None for an uncompressed response"""
+    weights = {}
+    for part in accept_encoding.split(','):
+        name, _, params = part.strip().partition(';')
+        if not name:
+            continue
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    
+    available = ['br', 'gzip'] if brotli else ['gzip']
+    candidates = [(weights.get(encoding, weights.get('*', 0.0)), -rank, encoding) for rank, encoding in enumerate(available)]
+    weight, _, encoding = max(candidates)
+    return encoding if weight > 0 else None
+
+def request_json(event):
+    """The JSON request body, API Gateway base64 encodes it for binary media types"""
+    body = event.get('body') or '{}'
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body).decode('utf-8')
+    return json.loads(body)
+
 def handle_upload(event, headers):
     try:
         print(f"Upload request received")
@@ -160,7 +279,9 @@ def handle_upload(event, headers):
                     s3.put_object(
                         Bucket=bucket,
                         Key=filename,
-                        Body=file_content
+                        Body=file_content,
+                        # Uploads through the API are someone waiting for the result
+                        Metadata={lanes.PRIORITY_KEY: 'interactive'}
                     )
                     
                     print(f"File uploaded: {filename}")
@@ -201,15 +322,16 @@ def serve_html(headers):
 
 def serve_dashboard(headers):
     try:
-        response = table.scan()
+        items, cache_state = list_documents()
         files = []
-        for item in response['Items']:
+        for item in items:
             converted_item = {}
             for key, value in item.items():
                 if isinstance(value, Decimal):
                     converted_item[key] = float(value)
                 else:
                     converted_item[key] = value
+            add_thumbnail_url(converted_item)
             files.append(converted_item)
         
         # Sort files by date (newest first)
@@ -218,10 +340,13 @@ def serve_dashboard(headers):
         files_html = ''.join([
             f'''<div class="file-card">
                 <div class="file-row">
+                    <input type="checkbox" class="file-select" value="{file.get('Name', '')}" style="margin-right: 12px;">
+                    {f'<img class="file-thumb" src="{file["ThumbnailUrl"]}" loading="lazy" alt="">' if file.get('ThumbnailUrl') else ''}
                     <div class="file-info">
                         <div class="file-header">
                             <div class="file-name">{file.get('Name', 'Unknown')}</div>
                             <div class="file-meta">
+                                {f'<span class="meta-duplicate" title="{int(file.get("Similarity", 0) * 100)}% similar">Duplicate of {file["DuplicateOf"]}</span>' if file.get('DuplicateOf') else ''}
                                 <span class="meta-type">{file.get('FileType', 'Unknown').upper()}</span>
                                 <span class="meta-size">{'%.1fKB' % (file.get('FileSize', 0)/1024) if file.get('FileSize', 0) < 1024*1024 else '%.1fMB' % (file.get('FileSize', 0)/1024/1024)}</span>
                                 <span class="meta-date">{file.get('TimeUploaded', 'Unknown')[:19].replace('T', ' ') if file.get('TimeUploaded') else 'Unknown'}</span>
@@ -269,9 +394,11 @@ def serve_dashboard(headers):
         .file-card:hover {{ background: #e9ecef; }}
         .file-row {{ display: flex; justify-content: space-between; align-items: center; }}
         .file-info {{ flex: 1; }}
+        .file-thumb {{ width: 48px; height: 48px; object-fit: cover; border-radius: 4px; margin-right: 12px; }}
         .file-header {{ display: flex; justify-content: space-between; align-items: center; margin-bottom: 4px; }}
         .file-name {{ font-weight: 600; color: #2c3e50; font-size: 1rem; }}
         .file-meta {{ display: flex; gap: 15px; color: #7f8c8d; font-size: 0.85rem; margin-right: 10px; }}
+        .meta-duplicate {{ color: #e67e22; }}
         .meta-type {{ min-width: 60px; text-align: right; }}
         .meta-size {{ min-width: 70px; text-align: right; }}
         .meta-date {{ min-width: 140px; text-align: right; }}
@@ -303,6 +430,10 @@ def serve_dashboard(headers):
             <div class="files-section">
                 <div class="files-header">
                     <h3>Processed Files ({len(files)})</h3>
+                    <div>
+                        <span id="bulkStatus" style="margin-right: 10px; color: #7f8c8d;"></span>
+                        <button class="btn btn-danger" onclick="deleteSelected()">Delete Selected</button>
+                    </div>
                 </div>
                 <div class="file-grid" id="filesList">
                 {files_html if files else '<div class="empty-state"><h3>No files yet</h3><p>Upload some documents to get started</p></div>'}
@@ -312,13 +443,54 @@ def serve_dashboard(headers):
             window.open('/Prod/download/' + encodeURIComponent(filename), '_blank');
         }}
         
+        // Texts already shown or prefetched on this page, opening the modal needs no request
+        const plaintexts = new Map();
+        // Names being read in a batch, to that batch's request
+        const prefetching = new Map();
+        
+        function prefetchPlaintexts(names) {{
+            // The batch route splits on commas, such names are read when their modal opens
+            names = names.filter(name => !plaintexts.has(name) && !prefetching.has(name) && !name.includes(','));
+            for (let start = 0; start < names.length; start += {MAX_BATCH_NAMES}) {{
+                const batch = names.slice(start, start + {MAX_BATCH_NAMES});
+                const request = fetch('/Prod/plaintext?names=' + batch.map(encodeURIComponent).join(','))
+                    .then(response => response.json())
+                    .then(data => {{
+                        for (const [name, text] of Object.entries(data.documents || {{}})) plaintexts.set(name, text);
+                    }})
+                    .catch(() => {{}})
+                    .finally(() => batch.forEach(name => prefetching.delete(name)));
+                batch.forEach(name => prefetching.set(name, request));
+            }}
+        }}
+        
+        // Read the texts of the rows on screen in one request once scrolling settles
+        const visibleNames = new Set();
+        let prefetchTimer = null;
+        const rowObserver = new IntersectionObserver(entries => {{
+            for (const entry of entries) {{
+                const name = entry.target.querySelector('.file-select').value;
+                if (entry.isIntersecting) visibleNames.add(name); else visibleNames.delete(name);
+            }}
+            clearTimeout(prefetchTimer);
+            prefetchTimer = setTimeout(() => prefetchPlaintexts(Array.from(visibleNames)), 200);
+        }});
+        document.querySelectorAll('.file-card').forEach(card => rowObserver.observe(card));
+        
         async function showPlaintext(filename) {{
             try {{
-                const response = await fetch('/Prod/plaintext/' + encodeURIComponent(filename));
-                const data = await response.json();
+                if (!plaintexts.has(filename) && prefetching.has(filename)) {{
+                    await prefetching.get(filename);
+                }}
+                // Not prefetched, or left out of its batch over the response size limit
+                if (!plaintexts.has(filename)) {{
+                    const response = await fetch('/Prod/plaintext/' + encodeURIComponent(filename));
+                    const data = await response.json();
+                    plaintexts.set(filename, data.plaintext);
+                }}
                 
                 document.getElementById('modalTitle').textContent = 'Extracted Text - ' + filename;
-                document.getElementById('modalText').textContent = data.plaintext || 'No text available';
+                document.getElementById('modalText').textContent = plaintexts.get(filename) || 'No text available';
                 document.getElementById('plaintextModal').style.display = 'block';
             }} catch (error) {{
                 alert('Error loading plaintext: ' + error.message);
@@ -329,6 +501,37 @@ def serve_dashboard(headers):
             document.getElementById('plaintextModal').style.display = 'none';
         }}
         
+        async function deleteSelected() {{
+            const names = Array.from(document.querySelectorAll('.file-select:checked')).map(box => box.value);
+            if (names.length === 0) return;
+            if (!confirm('Are you sure you want to delete ' + names.length + ' files?')) return;
+            
+            const status = document.getElementById('bulkStatus');
+            try {{
+                const response = await fetch('/Prod/bulk', {{
+                    method: 'POST',
+                    headers: {{'Content-Type': 'application/json'}},
+                    body: JSON.stringify({{'operation': 'delete', 'names': names}})
+                }});
+                const job = await response.json();
+                if (!response.ok) {{
+                    alert('Failed to delete files: ' + job.error);
+                    return;
+                }}
+                
+                // Poll the job until it finishes
+                while (true) {{
+                    await new Promise(resolve => setTimeout(resolve, 1000));
+                    const progress = await (await fetch('/Prod/jobs/' + encodeURIComponent(job.jobId))).json();
+                    status.textContent = 'Deleted ' + (progress.Processed || 0) + ' of ' + names.length;
+                    if (progress.Status === 'SUCCEEDED' || progress.Status === 'FAILED') break;
+                }}
+                window.location.reload();
+            }} catch (error) {{
+                alert('Error deleting files: ' + error.message);
+            }}
+        }}
+        
         async function deleteFile(filename) {{
             if (!confirm('Are you sure you want to delete ' + filename + '?')) return;
             
@@ -397,7 +600,8 @@ def serve_dashboard(headers):
                         method: 'PUT',
                         body: file,
                         headers: {{
-                            'Content-Type': file.type
+                            'Content-Type': file.type,
+                            ...urlData.headers
                         }}
                     }});
                     
@@ -426,7 +630,7 @@ def serve_dashboard(headers):
         
         return {
             'statusCode': 200,
-            'headers': {**headers, 'Content-Type': 'text/html'},
+            'headers': {**headers, 'Content-Type': 'text/html', 'X-Cache': cache_state.upper()},
             'body': html
         }
     except Exception as e:
@@ -436,31 +640,105 @@ def serve_dashboard(headers):
             'body': f'<html><body><h1>Error</h1><p>{str(e)}</p></body></html>'
         }
 
-def handle_get_files(headers):
-    response = table.scan()
+def handle_get_files(event, headers):
+    # The full text is only sent when asked for, /plaintext serves it per document
+    params = event.get('queryStringParameters') or {}
+    include_plaintext = params.get('include') == 'plaintext'
+    documents, cache_state = list_documents(include_plaintext=include_plaintext)
+    skipped = {'MinHash'} if include_plaintext else {'MinHash', 'Plaintext'}
     
     # Convert Decimal to float for JSON serialization
     items = []
-    for item in response['Items']:
+    for item in documents:
         converted_item = {}
         for key, value in item.items():
+            if key in skipped:
+                continue
             if isinstance(value, Decimal):
                 converted_item[key] = float(value)
             else:
                 converted_item[key] = value
+        add_thumbnail_url(converted_item)
         items.append(converted_item)
     
     return {
         'statusCode': 200,
-        'headers': headers,
+        'headers': {**headers, 'X-Cache': cache_state.upper()},
         'body': json.dumps({'files': items})
     }
 
+def list_documents(include_plaintext=False):
+    """Return all items of the document table and 'hit' or 'miss'.
+
+    The table is read page by page, and each page is cached by its start key
+    for LISTING_CACHE_TTL_SECONDS, so reloading the dashboard does not scan again.
+    Cached pages leave out the LISTING_OMITTED attributes, with include_plaintext
+    the table is scanned past the cache and the items are returned whole.
+    """
+    items = []
+    cache_state = 'hit'
+    start_key = None
+    while True:
+        cache_key = ('listing', json.dumps(start_key, sort_keys=True))
+        page = None if include_plaintext else cache.get(cache_key)
+        if page is None:
+            cache_state = 'miss'
+            response = table.scan(**({'ExclusiveStartKey': start_key} if start_key else {}))
+            page = {'items': response['Items'], 'next': response.get('LastEvaluatedKey')}
+            if not include_plaintext:
+                page['items'] = [
+                    {key: value for key, value in item.items() if key not in LISTING_OMITTED}
+                    for item in page['items']
+                ]
+                cache.put(cache_key, page, LISTING_CACHE_TTL_SECONDS)
+        
+        items.extend(page['items'])
+        start_key = page['next']
+        if not start_key:
+            return items, cache_state
+
+def get_document(bucket, name):
+    """Return a document's item (None if there is none) and 'hit', 'revalidated' or 'miss'"""
+    key = {'Name': name, 'Bucket': bucket}
+    
+    def current_version():
+        item = table.get_item(Key=key, ProjectionExpression=pipeline.ITEM_VERSION_ATTRIBUTE).get('Item')
+        return item.get(pipeline.ITEM_VERSION_ATTRIBUTE) if item else None
+    
+    item, cache_state = cache.get_or_revalidate(('item', bucket, name), current_version)
+    if cache_state != 'miss':
+        return item, cache_state
+    
+    item = table.get_item(Key=key).get('Item')
+    if item:
+        cache.put(('item', bucket, name), item, ITEM_CACHE_TTL_SECONDS, version=item.get(pipeline.ITEM_VERSION_ATTRIBUTE))
+    return item, 'miss'
+
+def add_thumbnail_url(item):
+    """Attach the item's thumbnail URL, if it has one.
+
+    The URL is the same on every request, /thumbnail/{name} redirects to the
+    presigned one, so the browser reuses the thumbnail it loaded before.
+    """
+    import urllib.parse
+    
+    if item.get('ThumbnailKey') and os.environ.get('DERIVATIVE_BUCKET_NAME'):
+        item['ThumbnailUrl'] = '/Prod/thumbnail/' + urllib.parse.quote(item['Name'], safe='')
+    return item
+
 def get_presigned_url(event, headers):
     try:
-        body = json.loads(event.get('body', '{}'))
+        body = request_json(event)
         filename = body.get('filename', 'uploaded_file')
         content_type = body.get('contentType', 'application/octet-stream')
+        # Uploads through the dashboard are interactive, scripts may ask for the bulk lane
+        priority = body.get('priority', 'interactive')
+        if priority not in lanes.PRIORITIES:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f"priority must be one of {', '.join(lanes.PRIORITIES)}"})
+            }
         
         bucket = os.environ.get('BUCKET_NAME')
         
@@ -470,7 +748,8 @@ def get_presigned_url(event, headers):
             Params={
                 'Bucket': bucket, 
                 'Key': filename,
-                'ContentType': content_type
+                'ContentType': content_type,
+                'Metadata': {lanes.PRIORITY_KEY: priority}
             },
             ExpiresIn=3600  # 1 hour
         )
@@ -481,7 +760,9 @@ def get_presigned_url(event, headers):
             'body': json.dumps({
                 'uploadUrl': presigned_url,
                 'filename': filename,
-                'contentType': content_type
+                'contentType': content_type,
+                # Signed into the URL, the PUT has to send them
+                'headers': {f'x-amz-meta-{lanes.PRIORITY_KEY}': priority}
             })
         }
         
@@ -518,6 +799,20 @@ def handle_delete(event, headers):
         # Delete from S3
         s3.delete_object(Bucket=bucket, Key=filename)
         
+        # Delete the analysis image and thumbnail, if any were made
+        derivative_bucket = os.environ.get('DERIVATIVE_BUCKET_NAME')
+        if derivative_bucket:
+            s3.delete_objects(
+                Bucket=derivative_bucket,
+                Delete={
+                    'Objects': [
+                        {'Key': f'analysis/{filename}.jpg'},
+                        {'Key': f'thumbnails/{filename}.jpg'}
+                    ],
+                    'Quiet': True
+                }
+            )
+        
         # Delete from DynamoDB
         table.delete_item(
             Key={
@@ -525,6 +820,8 @@ def handle_delete(event, headers):
                 'Bucket': bucket
             }
         )
+        cache.invalidate(('item', bucket, filename))
+        cache.invalidate_prefix(('listing',))
         
         return {
             'statusCode': 200,
@@ -540,6 +837,405 @@ def handle_delete(event, headers):
             'body': json.dumps({'error': str(e)})
         }
 
+def handle_bulk(event, headers):
+    try:
+        body = request_json(event)
+        operation = body.get('operation', 'delete')
+        names = body.get('names')
+        prefix = body.get('prefix')
+        destination = body.get('destination')
+        
+        if operation not in ('delete', 'move'):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unsupported operation: {operation}'})
+            }
+        
+        # Either an explicit list or a prefix; an empty prefix would select the whole bucket
+        if bool(names) == bool(prefix):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Provide either a list of names or a non-empty prefix'})
+            }
+        
+        if operation == 'move' and not destination:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Move needs a destination prefix'})
+            }
+        
+        if operation == 'move' and prefix and destination.startswith(prefix):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Destination must not be inside the source prefix'})
+            }
+        
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        job = {
+            'jobId': job_id,
+            'operation': operation,
+            'bucket': os.environ.get('BUCKET_NAME')
+        }
+        if destination:
+            job['destination'] = destination
+        
+        # Async invocations take at most 256KB, so long lists are split into parts
+        parts = [{**job, 'names': part} for part in split_names(names)] if names else [{**job, 'prefix': prefix}]
+        
+        job_record = {
+            'JobId': job_id,
+            'JobType': f'bulk-{operation}',
+            'Status': 'QUEUED',
+            'Parts': len(parts),
+            'PartsDone': 0,
+            'Processed': 0,
+            'Failed': 0,
+            'CreatedAt': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            # Job records clean themselves up after a week
+            'ExpiresAt': int((now + timedelta(days=7)).timestamp())
+        }
+        if names:
+            job_record['Total'] = len(names)
+        job_table.put_item(Item=job_record)
+        
+        # Run the job asynchronously, it can outlive the API Gateway timeout
+        for part in parts:
+            lambda_client.invoke(
+                FunctionName=os.environ.get('BULK_FUNCTION_NAME'),
+                InvocationType='Event',
+                Payload=json.dumps(part)
+            )
+        
+        print(f"Started bulk {operation} job {job_id}")
+        
+        return {
+            'statusCode': 202,
+            'headers': headers,
+            'body': json.dumps({'jobId': job_id, 'status': 'QUEUED'})
+        }
+        
+    except Exception as e:
+        print(f"Bulk error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def split_names(names, max_bytes=200 * 1024):
+    """Split a list of names into parts that fit in an async Lambda payload"""
+    parts = []
+    current = []
+    size = 0
+    for name in names:
+        name_size = len(json.dumps(name)) + 2
+        if current and size + name_size > max_bytes:
+            parts.append(current)
+            current = []
+            size = 0
+        current.append(name)
+        size += name_size
+    if current:
+        parts.append(current)
+    return parts
+
+def handle_export(event, headers):
+    try:
+        body = request_json(event)
+        file_format = body.get('format', 'jsonl')
+        text = body.get('text', 'item')
+        segments = int(body.get('segments') or os.environ.get('EXPORT_SEGMENTS', '16'))
+        prefix = body.get('prefix')
+        
+        if file_format not in ('jsonl', 'parquet'):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unsupported format: {file_format}'})
+            }
+        
+        if text not in ('item', 'full', 'none'):
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unsupported text mode: {text}'})
+            }
+        
+        if not 1 <= segments <= 256:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': 'Segments must be between 1 and 256'})
+            }
+        
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        job_table.put_item(Item={
+            'JobId': job_id,
+            'JobType': f'export-{file_format}',
+            'Status': 'QUEUED',
+            'Segments': segments,
+            'SegmentsDone': 0,
+            'Exported': 0,
+            'CreatedAt': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'ExpiresAt': int((now + timedelta(days=7)).timestamp())
+        })
+        
+        job = {'jobId': job_id, 'format': file_format, 'text': text, 'totalSegments': segments}
+        if prefix:
+            job['prefix'] = prefix
+        
+        # One worker per segment of a parallel scan, each with its own Lambda timeout
+        for segment in range(segments):
+            lambda_client.invoke(
+                FunctionName=os.environ.get('EXPORT_FUNCTION_NAME'),
+                InvocationType='Event',
+                Payload=json.dumps({**job, 'segment': segment})
+            )
+        
+        print(f"Started export job {job_id} with {segments} segments")
+        
+        return {
+            'statusCode': 202,
+            'headers': headers,
+            'body': json.dumps({'jobId': job_id, 'status': 'QUEUED'})
+        }
+        
+    except Exception as e:
+        print(f"Export error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def handle_reprocess(event, headers):
+    try:
+        body = request_json(event)
+        stages = body.get('stages') or list(pipeline.STAGE_VERSIONS)
+        prefix = body.get('prefix')
+        
+        unknown = [stage for stage in stages if stage not in pipeline.STAGE_VERSIONS]
+        if unknown:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Unknown stages: {", ".join(unknown)}'})
+            }
+        
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        job_table.put_item(Item={
+            'JobId': job_id,
+            'JobType': 'reprocess',
+            'Status': 'QUEUED',
+            'Stages': stages,
+            'Started': 0,
+            'Skipped': 0,
+            'CreatedAt': now.strftime('%Y-%m-%dT%H:%M:%S.%fZ'),
+            'ExpiresAt': int((now + timedelta(days=7)).timestamp())
+        })
+        
+        job = {'jobId': job_id, 'stages': stages}
+        if prefix:
+            job['prefix'] = prefix
+        
+        # Scanning the table and pacing the executions outlives the API Gateway timeout
+        lambda_client.invoke(
+            FunctionName=os.environ.get('REPROCESS_FUNCTION_NAME'),
+            InvocationType='Event',
+            Payload=json.dumps(job)
+        )
+        
+        print(f"Started reprocess job {job_id} for stages {stages}")
+        
+        return {
+            'statusCode': 202,
+            'headers': headers,
+            'body': json.dumps({'jobId': job_id, 'status': 'QUEUED'})
+        }
+        
+    except Exception as e:
+        print(f"Reprocess error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def handle_get_job(event, headers):
+    try:
+        import urllib.parse
+        
+        job_id = urllib.parse.unquote(event['path'].split('/jobs/', 1)[1])
+        job = job_table.get_item(Key={'JobId': job_id}).get('Item')
+        
+        if not job:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': f'Job {job_id} not found'})
+            }
+        
+        converted_job = {}
+        for key, value in job.items():
+            if isinstance(value, Decimal):
+                converted_job[key] = float(value)
+            else:
+                converted_job[key] = value
+        
+        # Finished exports link their manifest
+        if job.get('Manifest'):
+            converted_job['ManifestUrl'] = s3.generate_presigned_url(
+                'get_object',
+                Params={'Bucket': os.environ.get('EXPORT_BUCKET_NAME'), 'Key': job['Manifest']},
+                ExpiresIn=3600  # 1 hour
+            )
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps(converted_job)
+        }
+        
+    except Exception as e:
+        print(f"Job status error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def handle_get_similar(event, headers):
+    try:
+        import urllib.parse
+        
+        # Extract filename from path /similar/{filename}
+        filename = urllib.parse.unquote(event['path'].split('/similar/', 1)[1])
+        bucket = os.environ.get('BUCKET_NAME')
+        params = event.get('queryStringParameters') or {}
+        threshold = float(params.get('threshold', '0.5'))
+        
+        item = table.get_item(
+            Key={'Name': filename, 'Bucket': bucket},
+            ProjectionExpression='MinHash'
+        ).get('Item')
+        
+        if not item:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': f'{filename} has no similarity signature yet'})
+            }
+        
+        matches = similarity.find_similar(
+            dynamodb, table, index_table, bucket, filename,
+            similarity.from_bytes(item['MinHash'].value), threshold
+        )
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({
+                'name': filename,
+                'similar': [{'name': name, 'similarity': score} for name, score in matches]
+            })
+        }
+        
+    except Exception as e:
+        print(f"Similar files error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def handle_get_plaintext_batch(event, headers):
+    try:
+        # GET /plaintext?names=a,b,c or POST /plaintext {"names": [...]} for names containing commas
+        if event.get('httpMethod') == 'POST':
+            names = request_json(event).get('names') or []
+        else:
+            params = event.get('queryStringParameters') or {}
+            names = [name for name in (params.get('names') or '').split(',') if name]
+        names = list(dict.fromkeys(names))
+        bucket = os.environ.get('BUCKET_NAME')
+        
+        if not names or len(names) > MAX_BATCH_NAMES:
+            return {
+                'statusCode': 400,
+                'headers': headers,
+                'body': json.dumps({'error': f'Provide between 1 and {MAX_BATCH_NAMES} names'})
+            }
+        
+        # Fresh cached documents first, the rest in batches
+        items = {}
+        for name in names:
+            item = cache.get(('item', bucket, name))
+            if item is not None:
+                items[name] = item
+        hits = len(items)
+        
+        for item in get_items(bucket, [name for name in names if name not in items]):
+            items[item['Name']] = item
+            cache.put(('item', bucket, item['Name']), item, ITEM_CACHE_TTL_SECONDS, version=item.get(pipeline.ITEM_VERSION_ATTRIBUTE))
+        
+        documents = {}
+        remaining = []
+        size = 0
+        for name in names:
+            if name not in items:
+                continue
+            plaintext = items[name].get('Plaintext', 'No text available')
+            # json.dumps escapes non-ASCII text, a character can take up to 12 bytes
+            size += len(json.dumps({name: plaintext}))
+            if documents and size > MAX_BATCH_TEXT_BYTES:
+                remaining.append(name)
+                continue
+            documents[name] = plaintext
+        
+        print(f"Plaintext for {len(documents)} of {len(names)} documents, {hits} from the cache")
+        
+        return {
+            'statusCode': 200,
+            'headers': headers,
+            'body': json.dumps({
+                'documents': documents,
+                'missing': [name for name in names if name not in items],
+                # Left out to stay under the response size limit, request them again
+                'remaining': remaining
+            })
+        }
+        
+    except Exception as e:
+        print(f"Batch plaintext error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
+def get_items(bucket, names):
+    """Read full items 100 keys at a time, retrying unprocessed keys with backoff"""
+    items = []
+    for offset in range(0, len(names), DYNAMODB_READ_BATCH):
+        pending = {table.name: {'Keys': [{'Name': name, 'Bucket': bucket} for name in names[offset:offset + DYNAMODB_READ_BATCH]]}}
+        for attempt in range(MAX_RETRIES):
+            response = dynamodb.meta.client.batch_get_item(RequestItems=pending)
+            items.extend(response['Responses'].get(table.name, []))
+            pending = response.get('UnprocessedKeys', {})
+            if not pending:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 5))
+        else:
+            raise RuntimeError(f'DynamoDB left {len(pending[table.name]["Keys"])} keys unprocessed')
+    return items
+
 def handle_get_plaintext(event, headers):
     try:
         import urllib.parse
@@ -562,23 +1258,15 @@ def handle_get_plaintext(event, headers):
         
         print(f"Getting plaintext for: {filename} from bucket: {bucket}")
         
-        # Get plaintext from DynamoDB
-        response = table.get_item(
-            Key={
-                'Name': filename,
-                'Bucket': bucket
-            }
-        )
-        
-        print(f"DynamoDB response: {response}")
-        item = response.get('Item', {})
-        print(f"Item: {item}")
+        # Get plaintext from DynamoDB, or from the cache while the item is unchanged
+        item, cache_state = get_document(bucket, filename)
+        item = item or {}
         plaintext = item.get('Plaintext', 'No text available')
-        print(f"Plaintext: {plaintext[:100] if plaintext else 'None'}...")
+        print(f"Plaintext ({cache_state}): {plaintext[:100] if plaintext else 'None'}...")
         
         return {
             'statusCode': 200,
-            'headers': headers,
+            'headers': {**headers, 'X-Cache': cache_state.upper()},
             'body': json.dumps({'plaintext': plaintext})
         }
         
@@ -590,6 +1278,53 @@ def handle_get_plaintext(event, headers):
             'body': json.dumps({'error': str(e)})
         }
 
+def handle_thumbnail(event, headers):
+    try:
+        import urllib.parse
+        
+        # Extract filename from path /thumbnail/{filename}
+        filename = urllib.parse.unquote(event['path'].split('/thumbnail/', 1)[1])
+        bucket = os.environ.get('BUCKET_NAME')
+        derivative_bucket = os.environ.get('DERIVATIVE_BUCKET_NAME')
+        
+        item, cache_state = get_document(bucket, filename)
+        if not item or not item.get('ThumbnailKey') or not derivative_bucket:
+            return {
+                'statusCode': 404,
+                'headers': headers,
+                'body': json.dumps({'error': f'No thumbnail for {filename}'})
+            }
+        
+        thumbnail_url = s3.generate_presigned_url(
+            'get_object',
+            Params={
+                'Bucket': derivative_bucket,
+                'Key': item['ThumbnailKey'],
+                # The image is kept as long as the URL is valid
+                'ResponseCacheControl': f'private, max-age={THUMBNAIL_URL_SECONDS}'
+            },
+            ExpiresIn=THUMBNAIL_URL_SECONDS
+        )
+        
+        return {
+            'statusCode': 302,
+            'headers': {
+                **headers,
+                'Location': thumbnail_url,
+                'Cache-Control': f'private, max-age={THUMBNAIL_CACHE_SECONDS}',
+                'X-Cache': cache_state.upper()
+            },
+            'body': ''
+        }
+        
+    except Exception as e:
+        print(f"Thumbnail error: {str(e)}")
+        return {
+            'statusCode': 500,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
 def handle_download(event, headers):
     try:
         import urllib.parse
@@ -0,0 +1,363 @@
+import json
+import boto3
+import os
+import time
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import urlencode
+
+from src import lanes, pipeline, profiling, similarity
+
+DERIVATIVE_BUCKET = os.environ.get('DERIVATIVE_BUCKET_NAME')
+BULK_WORKERS = int(os.environ.get('BULK_WORKERS', '8'))
+
+# Chunks run in parallel and each chunk of a move copies in parallel again
+s3 = boto3.client('s3', config=Config(max_pool_connections=BULK_WORKERS * BULK_WORKERS))
+lambda_client = boto3.client('lambda')
+dynamodb = boto3.resource('dynamodb', config=Config(max_pool_connections=BULK_WORKERS))
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+index_table = dynamodb.Table(os.environ.get('SIMILARITY_INDEX_TABLE_NAME'))
+
+# Service limits per request
+S3_DELETE_BATCH = 1000
+DYNAMODB_WRITE_BATCH = 25
+DYNAMODB_READ_BATCH = 100
+
+# Hand over to a fresh invocation before the Lambda timeout hits
+MIN_REMAINING_MS = 60 * 1000
+MAX_RETRIES = 8
+MAX_RECORDED_ERRORS = 20
+
+# Item attributes that belong to the old object and are not carried over by a move
+MOVED_ITEM_DROPPED = {'ThumbnailKey', 'SourceSequencer', 'SourceETag', 'SourceVersionId'}
+
+# Keys of an object's derivatives in the derivative bucket
+THUMBNAIL_DERIVATIVE = 'thumbnails/{}.jpg'
+ANALYSIS_DERIVATIVE = 'analysis/{}.jpg'
+
+@profiling.profiled
+def lambda_handler(event, context):
+    job_id = event['jobId']
+    operation = event['operation']
+    bucket = event['bucket']
+
+    print(f"Running bulk {operation} job {job_id} in bucket {bucket}")
+    if not start_job(job_id):
+        # Another part of the job failed, the job stays FAILED
+        print(f"Bulk job {job_id} already ended, skipping this part")
+        return {'jobId': job_id, 'status': 'FAILED', 'error': 'Job already ended'}
+
+    try:
+        if operation == 'move' and event.get('prefix') and event['destination'].startswith(event['prefix']):
+            # The listing would pick up the copies again
+            raise ValueError('Destination must not be inside the source prefix')
+
+        with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+            futures = []
+            for chunk, resume in iterate_key_chunks(event):
+                if operation == 'delete':
+                    futures.append(executor.submit(delete_chunk, job_id, bucket, chunk))
+                elif operation == 'move':
+                    futures.append(executor.submit(move_chunk, job_id, bucket, chunk, event))
+                else:
+                    raise ValueError(f'Unsupported bulk operation: {operation}')
+
+                # Keep a bounded number of chunks in flight
+                if len(futures) >= BULK_WORKERS * 2:
+                    futures.pop(0).result()
+
+                if resume and context and context.get_remaining_time_in_millis() < MIN_REMAINING_MS:
+                    for future in futures:
+                        future.result()
+                    continue_in_new_invocation(event, resume, context)
+                    return {'jobId': job_id, 'status': 'CONTINUED'}
+
+            for future in futures:
+                future.result()
+
+        # Large name lists are split over several invocations, the last one to finish closes the job
+        response = job_table.update_item(
+            Key={'JobId': job_id},
+            UpdateExpression='ADD PartsDone :one',
+            ExpressionAttributeValues={':one': 1},
+            ReturnValues='ALL_NEW'
+        )
+        job = response['Attributes']
+        if job['PartsDone'] >= job.get('Parts', 1):
+            update_job(job_id, 'SUCCEEDED')
+            return {'jobId': job_id, 'status': 'SUCCEEDED'}
+        return {'jobId': job_id, 'status': 'RUNNING'}
+
+    except Exception as e:
+        print(f"Bulk job {job_id} failed: {str(e)}")
+        update_job(job_id, 'FAILED', error=str(e))
+        return {'jobId': job_id, 'status': 'FAILED', 'error': str(e)}
+
+def iterate_key_chunks(event):
+    """Yield (keys, resume_state) chunks of at most 1000 keys from a name list or a prefix listing.
+
+    resume_state is what a follow-up invocation needs to pick up after this chunk.
+    """
+    if 'names' in event:
+        names = event['names']
+        start = event.get('offset', 0)
+        for offset in range(start, len(names), S3_DELETE_BATCH):
+            end = offset + S3_DELETE_BATCH
+            yield names[offset:end], {'offset': end}
+        return
+
+    params = {'Bucket': event['bucket'], 'Prefix': event.get('prefix', ''), 'MaxKeys': S3_DELETE_BATCH}
+    if event.get('continuationToken'):
+        params['ContinuationToken'] = event['continuationToken']
+
+    while True:
+        response = s3.list_objects_v2(**params)
+        keys = [obj['Key'] for obj in response.get('Contents', [])]
+        token = response.get('NextContinuationToken')
+        if keys:
+            yield keys, {'continuationToken': token} if token else None
+        if not token:
+            return
+        params['ContinuationToken'] = token
+
+def continue_in_new_invocation(event, resume, context):
+    next_event = {key: value for key, value in event.items() if key not in ('offset', 'continuationToken')}
+    next_event.update(resume)
+    print(f"Continuing job {event['jobId']} in a new invocation from {resume}")
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps(next_event)
+    )
+
+def delete_chunk(job_id, bucket, keys):
+    deleted, errors = delete_objects(bucket, keys)
+
+    # Records and derivatives only go once the original is gone
+    write_batches([{'DeleteRequest': {'Key': {'Name': key, 'Bucket': bucket}}} for key in deleted])
+    delete_derivatives(deleted)
+
+    record_progress(job_id, len(deleted), errors)
+
+def move_chunk(job_id, bucket, keys, event):
+    prefix = event.get('prefix', '')
+    destination = event['destination']
+
+    def new_key_for(key):
+        return destination + key[len(prefix):] if prefix else destination + key
+
+    def copy(key):
+        # Tagged as moved, so lambda-start-workflow keeps the carried over results
+        # instead of processing the copy again. The copies keep their other tags
+        tags = {tag['Key']: tag['Value'] for tag in s3.get_object_tagging(Bucket=bucket, Key=key)['TagSet']}
+        tags[lanes.PRIORITY_KEY] = 'bulk'
+        tags[pipeline.MOVED_TAG] = 'true'
+        s3.copy_object(
+            Bucket=bucket,
+            Key=new_key_for(key),
+            CopySource={'Bucket': bucket, 'Key': key},
+            Tagging=urlencode(tags),
+            TaggingDirective='REPLACE'
+        )
+        return key, new_key_for(key)
+
+    def carry_over(item):
+        moved_item = {name: value for name, value in item.items() if name not in MOVED_ITEM_DROPPED}
+        moved_item['Name'] = new_key_for(item['Name'])
+        moved_item[pipeline.MOVED_FROM_ATTRIBUTE] = item['Name']
+        copied = copy_derivatives(item['Name'], moved_item['Name'])
+        if item.get('ThumbnailKey') and THUMBNAIL_DERIVATIVE in copied:
+            moved_item['ThumbnailKey'] = THUMBNAIL_DERIVATIVE.format(moved_item['Name'])
+        # The image that reprocessing analyses, the original or its analysis derivative
+        analysis_object = item.get('AnalysisObject')
+        if analysis_object:
+            if analysis_object['key'] == item['Name']:
+                moved_item['AnalysisObject'] = {'bucket': bucket, 'key': moved_item['Name']}
+            elif ANALYSIS_DERIVATIVE in copied:
+                moved_item['AnalysisObject'] = {'bucket': DERIVATIVE_BUCKET, 'key': ANALYSIS_DERIVATIVE.format(moved_item['Name'])}
+            else:
+                del moved_item['AnalysisObject']
+        return moved_item
+
+    # Carry the processing results over, the copies are not processed again.
+    # They are written before the copies, so lambda-start-workflow finds them
+    # when the copies' events arrive. The source version is left out, the copy
+    # claims the item as its own
+    items, unread = get_items(bucket, keys)
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+        moved_items = list(executor.map(carry_over, items))
+    write_batches([{'PutRequest': {'Item': item}} for item in moved_items])
+
+    # Objects whose results could not be read stay where they are, moving them would lose the results
+    errors = [f'{key}: its record could not be read, DynamoDB left it unprocessed' for key in unread]
+    unread = set(unread)
+    keys = [key for key in keys if key not in unread]
+    moved = {}
+    # copy_object has no batch form, run the copies side by side
+    with ThreadPoolExecutor(max_workers=BULK_WORKERS) as executor:
+        futures = {executor.submit(copy, key): key for key in keys}
+        for future, key in futures.items():
+            try:
+                old_key, new_key = future.result()
+                moved[old_key] = new_key
+            except Exception as e:
+                errors.append(f'{key}: {str(e)}')
+
+    deleted, delete_errors = delete_objects(bucket, list(moved))
+    errors.extend(delete_errors)
+
+    requests = [{'DeleteRequest': {'Key': {'Name': key, 'Bucket': bucket}}} for key in deleted]
+    requests.extend(
+        {'DeleteRequest': {'Key': {'Name': new_key_for(item['Name']), 'Bucket': bucket}}}
+        for item in items if item['Name'] not in moved
+    )
+    write_batches(requests)
+    # The old keys' derivatives, and the copies made for objects that were not moved
+    delete_derivatives(deleted + [new_key_for(item['Name']) for item in items if item['Name'] not in moved])
+
+    # The old key's index entries are dropped by the next lookup that finds them
+    for item in moved_items:
+        if item[pipeline.MOVED_FROM_ATTRIBUTE] in moved and 'MinHash' in item:
+            similarity.update_index(index_table, bucket, item['Name'], similarity.from_bytes(item['MinHash'].value))
+
+    record_progress(job_id, len(deleted), errors)
+
+def delete_objects(bucket, keys):
+    """Delete up to 1000 keys in one call and return (deleted keys, error messages)"""
+    if not keys:
+        return [], []
+
+    response = s3.delete_objects(
+        Bucket=bucket,
+        Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+    )
+    # Quiet mode only reports the failures
+    failed = {error['Key']: error.get('Message', error.get('Code')) for error in response.get('Errors', [])}
+    deleted = [key for key in keys if key not in failed]
+    return deleted, [f'{key}: {message}' for key, message in failed.items()]
+
+def copy_derivatives(key, new_key):
+    """Copy a moved object's derivatives to its new key, returns the ones it had"""
+    if not DERIVATIVE_BUCKET:
+        return []
+
+    copied = []
+    for derivative in (THUMBNAIL_DERIVATIVE, ANALYSIS_DERIVATIVE):
+        try:
+            s3.copy_object(
+                Bucket=DERIVATIVE_BUCKET,
+                Key=derivative.format(new_key),
+                CopySource={'Bucket': DERIVATIVE_BUCKET, 'Key': derivative.format(key)}
+            )
+            copied.append(derivative)
+        except ClientError as e:
+            # Documents that are not images have none
+            if e.response['Error']['Code'] not in ('404', 'NoSuchKey'):
+                raise
+    return copied
+
+def delete_derivatives(keys):
+    if not DERIVATIVE_BUCKET or not keys:
+        return
+
+    derivative_keys = []
+    for key in keys:
+        derivative_keys.append({'Key': ANALYSIS_DERIVATIVE.format(key)})
+        derivative_keys.append({'Key': THUMBNAIL_DERIVATIVE.format(key)})
+
+    for offset in range(0, len(derivative_keys), S3_DELETE_BATCH):
+        s3.delete_objects(
+            Bucket=DERIVATIVE_BUCKET,
+            Delete={'Objects': derivative_keys[offset:offset + S3_DELETE_BATCH], 'Quiet': True}
+        )
+
+def write_batches(requests):
+    """Send write requests 25 at a time, retrying unprocessed items with backoff"""
+    for offset in range(0, len(requests), DYNAMODB_WRITE_BATCH):
+        pending = {table.name: requests[offset:offset + DYNAMODB_WRITE_BATCH]}
+        for attempt in range(MAX_RETRIES):
+            response = dynamodb.meta.client.batch_write_item(RequestItems=pending)
+            pending = response.get('UnprocessedItems', {})
+            if not pending:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 5))
+        else:
+            raise RuntimeError(f'DynamoDB left {len(pending[table.name])} writes unprocessed')
+
+def get_items(bucket, keys):
+    """Read full items 100 keys at a time, retrying unprocessed keys with backoff.
+
+    Returns (items, keys DynamoDB still left unprocessed after MAX_RETRIES attempts)
+    """
+    items = []
+    unread = []
+    for offset in range(0, len(keys), DYNAMODB_READ_BATCH):
+        pending = {table.name: {'Keys': [{'Name': key, 'Bucket': bucket} for key in keys[offset:offset + DYNAMODB_READ_BATCH]]}}
+        for attempt in range(MAX_RETRIES):
+            response = dynamodb.meta.client.batch_get_item(RequestItems=pending)
+            items.extend(response['Responses'].get(table.name, []))
+            pending = response.get('UnprocessedKeys', {})
+            if not pending:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 5))
+        else:
+            unread.extend(key['Name'] for key in pending[table.name]['Keys'])
+    return items, unread
+
+def record_progress(job_id, processed, errors):
+    # PROCESSED is a DynamoDB reserved word
+    expression = 'ADD #processed :processed, #failed :failed SET UpdatedAt = :now'
+    values = {
+        ':processed': processed,
+        ':failed': len(errors),
+        ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+    }
+    if errors:
+        # Only keep the latest few so the job item stays small
+        expression += ', LastErrors = :errors'
+        values[':errors'] = errors[:MAX_RECORDED_ERRORS]
+
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression=expression,
+        ExpressionAttributeNames={'#processed': 'Processed', '#failed': 'Failed'},
+        ExpressionAttributeValues=values
+    )
+
+def start_job(job_id):
+    """Mark the job running, returns False when it already ended (another part failed)"""
+    try:
+        job_table.update_item(
+            Key={'JobId': job_id},
+            UpdateExpression='SET #status = :status, UpdatedAt = :now',
+            ConditionExpression='#status IN (:queued, :running)',
+            ExpressionAttributeNames={'#status': 'Status'},
+            ExpressionAttributeValues={
+                ':status': 'RUNNING',
+                ':queued': 'QUEUED',
+                ':running': 'RUNNING',
+                ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            }
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+
+def update_job(job_id, status, error=None):
+    expression = 'SET #status = :status, UpdatedAt = :now'
+    values = {':status': status, ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+    if error:
+        expression += ', JobError = :error'
+        values[':error'] = error
+
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression=expression,
+        ExpressionAttributeNames={'#status': 'Status'},
+        ExpressionAttributeValues=values
+    )
@@ -2,10 +2,16 @@ import json
 import boto3
 import os
 
+from src import pipeline, profiling
+
 client = boto3.client('comprehend')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
 
+# DetectKeyPhrases accepts at most 100KB of UTF-8 text
+MAX_TEXT_BYTES = 100000
+
+@profiling.profiled
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
@@ -13,11 +19,12 @@ def lambda_handler(event, context):
     # Get plaintext from DynamoDB
     response = table.get_item(Key={'Name': key, 'Bucket': bucket})
     plaintext = response['Item']['Plaintext']
+    plaintext = plaintext.encode('utf-8')[:MAX_TEXT_BYTES].decode('utf-8', errors='ignore')
     
     # Use Comprehend to summarize text
     comprehend_response = client.detect_key_phrases(
         Text=plaintext,
-        LanguageCode='en'
+        LanguageCode=event.get('languageCode', 'en')
     )
     
     # Extract key phrases and create summary
@@ -30,13 +37,20 @@ def lambda_handler(event, context):
         summary = ' '.join(words[:15])
     
     # Store summary directly in DynamoDB
-    table.update_item(
+    update_expression, values = pipeline.stamp(
+        'summary',
+        'SET Summary = :summary, Summarizer = :summarizer',
+        {':summary': summary, ':summarizer': 'comprehend'}
+    )
+    pipeline.update_item(
+        table, event,
         Key={'Name': key, 'Bucket': bucket},
-        UpdateExpression='SET Summary = :summary',
-        ExpressionAttributeValues={':summary': summary}
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=values
     )
     
     return {
         'bucket': bucket,
-        'key': key
+        'key': key,
+        **pipeline.context(event)
     }
\ No newline at end of file
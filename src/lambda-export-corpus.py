@@ -0,0 +1,215 @@
+import json
+import boto3
+import io
+import os
+from botocore.exceptions import ClientError
+from datetime import datetime
+
+from src import export_writer, extractors, pipeline, profiling
+from src.extractors.sniff import MIME_FORMATS
+
+s3 = boto3.client('s3')
+lambda_client = boto3.client('lambda')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+
+EXPORT_BUCKET = os.environ.get('EXPORT_BUCKET_NAME')
+
+# Must match lambda-extract-text, stored text of this many UTF-8 bytes was cut at extraction
+MAX_PLAINTEXT_BYTES = int(os.environ.get('MAX_PLAINTEXT_BYTES', str(pipeline.MAX_PLAINTEXT_BYTES)))
+
+# The cut text is stripped afterwards, so it can end up a little shorter
+TRUNCATION_SLACK = 1024
+
+# Hand over to a fresh invocation before the Lambda timeout hits
+MIN_REMAINING_MS = 60 * 1000
+
+@profiling.profiled
+def lambda_handler(event, context):
+    """Export one segment of a parallel scan of DocumentTable to compressed part files.
+
+    Event: {jobId, format, text ('item', 'full' or 'none'), prefix (optional),
+            segment, totalSegments, exclusiveStartKey and parts (when continuing)}
+
+    The API starts one invocation per segment. The last segment to finish writes manifest.json.
+    """
+    job_id = event['jobId']
+    segment = event['segment']
+    total_segments = event['totalSegments']
+    file_format = event.get('format', 'jsonl')
+    text_mode = event.get('text', 'item')
+    parts = list(event.get('parts', []))
+    recorded = len(parts)
+
+    print(f"Exporting segment {segment + 1}/{total_segments} of job {job_id} as {file_format}")
+    if not parts and 'exclusiveStartKey' not in event:
+        start_job(job_id)
+
+    def upload(data, rows):
+        key = f"{job_id}/segment={segment:04d}/part-{len(parts):05d}.{export_writer.EXTENSIONS[file_format]}"
+        s3.put_object(Bucket=EXPORT_BUCKET, Key=key, Body=data)
+        parts.append({'key': key, 'rows': rows, 'bytes': len(data)})
+
+    try:
+        columns = export_columns(text_mode)
+        writer = export_writer.create_writer(file_format, upload, columns=columns)
+
+        # Attribute names like Name and Summary are reserved words
+        names = {f'#c{index}': column for index, column in enumerate(columns)}
+        scan_kwargs = {
+            'Segment': segment,
+            'TotalSegments': total_segments,
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+        if event.get('prefix'):
+            scan_kwargs['FilterExpression'] = 'begins_with(#name, :prefix)'
+            scan_kwargs['ExpressionAttributeNames'] = {**names, '#name': 'Name'}
+            scan_kwargs['ExpressionAttributeValues'] = {':prefix': event['prefix']}
+        if event.get('exclusiveStartKey'):
+            scan_kwargs['ExclusiveStartKey'] = event['exclusiveStartKey']
+
+        while True:
+            response = table.scan(**scan_kwargs)
+            for item in response['Items']:
+                if text_mode == 'full':
+                    item['Plaintext'] = full_text(item)
+                writer.write(export_writer.to_row(item, columns))
+
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+            if context and context.get_remaining_time_in_millis() < MIN_REMAINING_MS:
+                # Close the open part so the next invocation starts a new one
+                writer.close()
+                record_progress(job_id, parts[recorded:])
+                continue_in_new_invocation(event, response['LastEvaluatedKey'], parts, context)
+                return {'jobId': job_id, 'segment': segment, 'status': 'CONTINUED'}
+
+        writer.close()
+        record_progress(job_id, parts[recorded:])
+        finish_segment(event, parts)
+        return {'jobId': job_id, 'segment': segment, 'status': 'SUCCEEDED', 'parts': len(parts)}
+
+    except Exception as e:
+        print(f"Export job {job_id} segment {segment} failed: {str(e)}")
+        update_job(job_id, 'FAILED', error=f'Segment {segment}: {str(e)}')
+        return {'jobId': job_id, 'segment': segment, 'status': 'FAILED', 'error': str(e)}
+
+def export_columns(text_mode):
+    return [column for column in export_writer.COLUMN_NAMES if text_mode != 'none' or column != 'Plaintext']
+
+def full_text(item):
+    """The item's text, read again from the file when it was cut at the extraction limit"""
+    plaintext = item.get('Plaintext') or ''
+    file_format = MIME_FORMATS.get(item.get('MimeType'))
+    if len(plaintext.encode('utf-8')) < MAX_PLAINTEXT_BYTES - TRUNCATION_SLACK or not file_format:
+        return plaintext
+
+    body = s3.get_object(Bucket=item['Bucket'], Key=item['Name'])['Body']
+    fileobj = io.BytesIO(body.read()) if file_format in extractors.ZIP_FORMATS else body
+    return extractors.extract_text(file_format, fileobj, encoding=item.get('TextEncoding')).strip()
+
+def finish_segment(event, parts):
+    """Record the segment's parts, and write the manifest when it is the last segment"""
+    job_id = event['jobId']
+    s3.put_object(
+        Bucket=EXPORT_BUCKET,
+        Key=f"{job_id}/_segments/segment={event['segment']:04d}.json",
+        Body=json.dumps(parts)
+    )
+
+    job = job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression='ADD SegmentsDone :one',
+        ExpressionAttributeValues={':one': 1},
+        ReturnValues='ALL_NEW'
+    )['Attributes']
+    if job['SegmentsDone'] < job['Segments']:
+        return
+
+    all_parts = []
+    for segment in range(event['totalSegments']):
+        response = s3.get_object(Bucket=EXPORT_BUCKET, Key=f"{job_id}/_segments/segment={segment:04d}.json")
+        all_parts.extend(json.loads(response['Body'].read()))
+
+    manifest_key = f"{job_id}/manifest.json"
+    s3.put_object(
+        Bucket=EXPORT_BUCKET,
+        Key=manifest_key,
+        ContentType='application/json',
+        Body=json.dumps({
+            'jobId': job_id,
+            'format': event.get('format', 'jsonl'),
+            'compression': 'zstd' if event.get('format') == 'parquet' else 'gzip',
+            'columns': export_columns(event.get('text', 'item')),
+            'segments': event['totalSegments'],
+            'rows': sum(part['rows'] for part in all_parts),
+            'bytes': sum(part['bytes'] for part in all_parts),
+            'parts': all_parts,
+            'createdAt': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        }, indent=2)
+    )
+    print(f"Export job {job_id} finished, manifest at s3://{EXPORT_BUCKET}/{manifest_key}")
+
+    if job.get('Status') != 'FAILED':
+        update_job(job_id, 'SUCCEEDED', manifest=manifest_key)
+
+def continue_in_new_invocation(event, exclusive_start_key, parts, context):
+    next_event = {**event, 'exclusiveStartKey': exclusive_start_key, 'parts': parts}
+    print(f"Continuing job {event['jobId']} segment {event['segment']} in a new invocation")
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps(next_event)
+    )
+
+def start_job(job_id):
+    """Mark the job running, unless another segment already did or one of them failed"""
+    try:
+        job_table.update_item(
+            Key={'JobId': job_id},
+            UpdateExpression='SET #status = :status, UpdatedAt = :now',
+            ConditionExpression='#status = :queued',
+            ExpressionAttributeNames={'#status': 'Status'},
+            ExpressionAttributeValues={
+                ':status': 'RUNNING',
+                ':queued': 'QUEUED',
+                ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def record_progress(job_id, parts):
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression='ADD Exported :rows, #bytes :bytes, #parts :parts SET UpdatedAt = :now',
+        ExpressionAttributeNames={'#bytes': 'Bytes', '#parts': 'Parts'},
+        ExpressionAttributeValues={
+            ':rows': sum(part['rows'] for part in parts),
+            ':bytes': sum(part['bytes'] for part in parts),
+            ':parts': len(parts),
+            ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        }
+    )
+
+def update_job(job_id, status, error=None, manifest=None):
+    expression = 'SET #status = :status, UpdatedAt = :now'
+    values = {':status': status, ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+    if error:
+        expression += ', JobError = :error'
+        values[':error'] = error
+    if manifest:
+        expression += ', Manifest = :manifest'
+        values[':manifest'] = manifest
+
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression=expression,
+        ExpressionAttributeNames={'#status': 'Status'},
+        ExpressionAttributeValues=values
+    )
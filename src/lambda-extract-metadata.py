@@ -1,12 +1,15 @@
 import json
 import boto3
 import os
-from datetime import datetime
+from datetime import timezone
+
+from src import pipeline, profiling
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
 
+@profiling.profiled
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
@@ -15,21 +18,40 @@ def lambda_handler(event, context):
         # Get file metadata from S3
         response = s3.head_object(Bucket=bucket, Key=key)
         
-        # Extract file extension
-        file_type = key.split('.')[-1].lower() if '.' in key else 'unknown'
+        # Sniffed content type and encoding, when the workflow provides them
+        content = event.get('content') or {}
+        mime_type = content.get('mimeType')
+        
+        # Extract file extension, or name the sniffed type for files without one
+        if '.' in key:
+            file_type = key.split('.')[-1].lower()
+        elif mime_type:
+            file_type = mime_type.split('/')[-1].split('.')[-1].split('+')[0]
+        else:
+            file_type = 'unknown'
+        
+        # The object's own timestamp, so reprocessing does not move the upload time
+        update_expression = 'SET FileType = :file_type, FileSize = :file_size, TimeUploaded = :time_uploaded'
+        expression_values = {
+            ':file_type': file_type,
+            ':file_size': response['ContentLength'],
+            ':time_uploaded': response['LastModified'].astimezone(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        }
+        if mime_type:
+            update_expression += ', MimeType = :mime_type, TextEncoding = :encoding'
+            expression_values[':mime_type'] = mime_type
+            expression_values[':encoding'] = content.get('encoding')
+        update_expression, expression_values = pipeline.stamp('metadata', update_expression, expression_values)
         
         # Update metadata in DynamoDB
-        table.update_item(
+        pipeline.update_item(
+            table, event,
             Key={
                 'Name': key,
                 'Bucket': bucket
             },
-            UpdateExpression='SET FileType = :file_type, FileSize = :file_size, TimeUploaded = :time_uploaded',
-            ExpressionAttributeValues={
-                ':file_type': file_type,
-                ':file_size': response['ContentLength'],
-                ':time_uploaded': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
-            }
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_values
         )
         
         return {
@@ -38,6 +60,8 @@ def lambda_handler(event, context):
             'metadata': 'stored'
         }
         
+    except pipeline.Superseded:
+        raise
     except Exception as e:
         return {
             'bucket': bucket,
@@ -1,78 +1,160 @@
 import json
 import boto3
-import zipfile
-import xml.etree.ElementTree as ET
-from io import BytesIO
+import io
 import os
 
+from src import extractors, pipeline, profiling, similarity
+from src.extractors.sniff import SNIFF_BYTES, sniff
+
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+index_table = dynamodb.Table(os.environ.get('SIMILARITY_INDEX_TABLE_NAME'))
+
+# Documents at least this similar (estimated Jaccard of their 5-word shingles) are near-duplicates
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '0.9'))
+
+# UTF-8 bytes of Plaintext, see pipeline.MAX_PLAINTEXT_BYTES
+MAX_PLAINTEXT_BYTES = int(os.environ.get('MAX_PLAINTEXT_BYTES', str(pipeline.MAX_PLAINTEXT_BYTES)))
+
+# Zip based documents larger than this are read with ranged GETs instead of in one piece
+STREAM_THRESHOLD_BYTES = int(os.environ.get('STREAM_THRESHOLD_BYTES', str(8 * 1024 * 1024)))
 
+@profiling.profiled
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
-    
+
     try:
-        # Get the file from S3
-        response = s3.get_object(Bucket=bucket, Key=key)
-        content = response['Body'].read()
-        
-        # Handle .docx files
-        if key.lower().endswith('.docx'):
-            text = extract_docx_text(content)
-        else:
-            # Decode text content for other file types
-            try:
-                text = content.decode('utf-8')
-            except UnicodeDecodeError:
-                try:
-                    text = content.decode('latin-1')
-                except UnicodeDecodeError:
-                    text = "Unable to decode text file"
-        
+        # The workflow sniffs the content up front, only sniff here when invoked without it
+        content = event.get('content')
+        if not content:
+            response = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{SNIFF_BYTES - 1}')
+            content = sniff(response['Body'].read(), key)
+
+        file_format = content['format']
+        if file_format is None:
+            print(f"No extractor for {key} ({content['mimeType']})")
+            return {
+                'bucket': bucket,
+                'key': key,
+                'wordCount': 0
+            }
+
+        print(f"Extracting {key} as {file_format} ({content['mimeType']}, {content['encoding']})")
+
+        try:
+            text = extractors.extract_text(
+                file_format,
+                open_object(bucket, key, file_format),
+                # Every character takes at least one byte, the text is cut to bytes below
+                MAX_PLAINTEXT_BYTES,
+                encoding=content['encoding']
+            )
+            failed = False
+            extracted = bool(text.strip())
+            if not extracted and file_format != 'text':
+                text = "No text found in document"
+        except Exception as e:
+            failed = True
+            extracted = False
+            text = f"Error extracting .{file_format} text: {str(e)}"
+
+        text = pipeline.truncate_utf8(text.strip(), MAX_PLAINTEXT_BYTES)
+
+        # Calculate word count
+        word_count = len(text.split()) if text else 0
+
         # Store plaintext in DynamoDB immediately
-        table.update_item(
+        update_expression = 'SET Plaintext = :plaintext, WordCount = :word_count'
+        values = {':plaintext': text, ':word_count': word_count}
+
+        # A failed extraction leaves the stage unversioned so reprocessing retries it
+        if not failed:
+            update_expression, values = pipeline.stamp('extract', update_expression, values)
+        pipeline.update_item(
+            table, event,
             Key={'Name': key, 'Bucket': bucket},
-            UpdateExpression='SET Plaintext = :plaintext',
-            ExpressionAttributeValues={':plaintext': text.strip()}
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
         )
-        
-        # Calculate word count
-        word_count = len(text.strip().split()) if text.strip() else 0
-        
+
+        if extracted:
+            try:
+                duplicate_of = similarity.index_document(
+                    dynamodb, table, index_table, bucket, key, text, DUPLICATE_THRESHOLD,
+                    update_item=lambda **kwargs: pipeline.update_item(table, event, **kwargs)
+                )
+                if duplicate_of:
+                    print(f"{key} is a near-duplicate of {duplicate_of}")
+            except pipeline.Superseded:
+                raise
+            except Exception as e:
+                print(f"Error indexing {key} for similarity: {str(e)}")
+
         return {
             'bucket': bucket,
             'key': key,
-            'wordCount': word_count
+            'wordCount': word_count,
+            **pipeline.context(event)
         }
-        
+
+    except pipeline.Superseded:
+        raise
     except Exception as e:
         return {
             'bucket': bucket,
             'key': key,
-            'summary': f"Error reading file: {str(e)}"
+            'summary': f"Error reading file: {str(e)}",
+            'wordCount': 0,
+            **pipeline.context(event)
         }
 
-def extract_docx_text(content):
-    """Extract text from .docx file content"""
-    try:
-        # .docx files are zip archives
-        with zipfile.ZipFile(BytesIO(content), 'r') as docx:
-            # Read the main document XML
-            xml_content = docx.read('word/document.xml')
-            
-        # Parse XML and extract text
-        root = ET.fromstring(xml_content)
-        
-        # Define namespace
-        namespace = {'w': 'http://schemas.openxmlformats.org/wordprocessingml/2006/main'}
-        
-        # Extract all text elements
-        text_elements = root.findall('.//w:t', namespace)
-        text = '\n'.join([elem.text for elem in text_elements if elem.text])
-        
-        return text if text else "No text found in document"
-        
-    except Exception as e:
-        return f"Error extracting .docx text: {str(e)}"
\ No newline at end of file
+def open_object(bucket, key, file_format):
+    """Open the S3 object as a file object suited to the extractor"""
+    if file_format not in extractors.ZIP_FORMATS:
+        # Streaming extractors read the response body as it arrives
+        return s3.get_object(Bucket=bucket, Key=key)['Body']
+
+    # Zip archives need to seek to the central directory at the end
+    size = s3.head_object(Bucket=bucket, Key=key)['ContentLength']
+    if size <= STREAM_THRESHOLD_BYTES:
+        return io.BytesIO(s3.get_object(Bucket=bucket, Key=key)['Body'].read())
+    return io.BufferedReader(S3RangeReader(bucket, key, size), buffer_size=1024 * 1024)
+
+class S3RangeReader(io.RawIOBase):
+    """Seekable read-only view of an S3 object that fetches only the byte ranges being read"""
+
+    def __init__(self, bucket, key, size):
+        self.bucket = bucket
+        self.key = key
+        self.size = size
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.size + offset
+        return self.position
+
+    def readinto(self, buffer):
+        if self.position >= self.size:
+            return 0
+        end = min(self.position + len(buffer), self.size) - 1
+        response = s3.get_object(Bucket=self.bucket, Key=self.key, Range=f'bytes={self.position}-{end}')
+        data = response['Body'].read()
+        buffer[:len(data)] = data
+        self.position += len(data)
+        return len(data)
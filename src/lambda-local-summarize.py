@@ -0,0 +1,88 @@
+import json
+import boto3
+import os
+
+from src import pipeline, profiling, summarizer
+
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+
+# Documents up to this many words are summarized in process, larger ones by Comprehend
+LOCAL_SUMMARY_MAX_WORDS = int(os.environ.get('LOCAL_SUMMARY_MAX_WORDS', '20000'))
+
+# Below this share of English stopwords the text is probably not English,
+# the local engine only knows English stopwords so Comprehend takes it
+MIN_STOPWORD_RATIO = float(os.environ.get('MIN_STOPWORD_RATIO', '0.15'))
+
+# Per-tenant overrides keyed by object key prefix, e.g.
+# {"legal/": {"engine": "comprehend"}, "de/": {"engine": "comprehend", "languageCode": "de"}}
+TENANT_CONFIG = json.loads(os.environ.get('SUMMARIZER_TENANT_CONFIG') or '{}')
+
+@profiling.profiled
+def lambda_handler(event, context):
+    bucket = event['bucket']
+    key = event['key']
+    word_count = event.get('wordCount', 0)
+
+    tenant = tenant_config(key)
+    engine = tenant.get('engine', 'auto')
+    language_code = tenant.get('languageCode', 'en')
+
+    if engine == 'auto':
+        engine = 'local' if word_count <= LOCAL_SUMMARY_MAX_WORDS and language_code == 'en' else 'comprehend'
+
+    # Plaintext can be up to pipeline.MAX_PLAINTEXT_BYTES, only read it when summarizing here
+    projection = 'DuplicateOf, Plaintext' if engine == 'local' else 'DuplicateOf'
+    item = table.get_item(Key={'Name': key, 'Bucket': bucket}, ProjectionExpression=projection).get('Item', {})
+
+    # A near-duplicate reuses the summary of the document it duplicates
+    original_summary = None
+    if item.get('DuplicateOf'):
+        original = table.get_item(
+            Key={'Name': item['DuplicateOf'], 'Bucket': bucket},
+            ProjectionExpression='Summary'
+        ).get('Item', {})
+        if original.get('Summary') and original['Summary'] != 'Unprocessed':
+            original_summary = original['Summary']
+
+    if original_summary:
+        engine = 'duplicate'
+        store_summary(event, original_summary, engine)
+    elif engine == 'local':
+        plaintext = item.get('Plaintext', '')
+
+        if tenant.get('engine') != 'local' and summarizer.stopword_ratio(plaintext) < MIN_STOPWORD_RATIO:
+            engine = 'comprehend'
+        else:
+            store_summary(event, summarizer.summarize(plaintext), engine)
+
+    print(f"Summarizing {key} ({word_count} words) with {engine}")
+
+    return {
+        'bucket': bucket,
+        'key': key,
+        'wordCount': word_count,
+        'summarizer': engine,
+        'languageCode': language_code,
+        **pipeline.context(event)
+    }
+
+def store_summary(event, summary, engine):
+    update_expression, values = pipeline.stamp(
+        'summary',
+        'SET Summary = :summary, Summarizer = :summarizer',
+        {':summary': summary, ':summarizer': engine}
+    )
+    pipeline.update_item(
+        table, event,
+        Key={'Name': event['key'], 'Bucket': event['bucket']},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=values
+    )
+
+def tenant_config(key):
+    """Return the config of the longest matching tenant prefix"""
+    prefixes = [prefix for prefix in TENANT_CONFIG if key.startswith(prefix)]
+    if not prefixes:
+        return {}
+    return TENANT_CONFIG[max(prefixes, key=len)]
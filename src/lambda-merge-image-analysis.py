@@ -0,0 +1,49 @@
+import json
+import boto3
+import os
+
+from src import pipeline, profiling
+
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+
+@profiling.profiled
+def lambda_handler(event, context):
+    bucket = event['bucket']
+    key = event['key']
+
+    # Output of the parallel branches: [Textract result, Rekognition labels]
+    textract_result, labels_result = event['imageAnalysis']
+    word_count = textract_result.get('wordCount', 0)
+    labels = labels_result.get('labels', [])
+
+    if word_count > 0:
+        # The poller already stored the OCR text as Plaintext, keep it and
+        # record the labels alongside it
+        update_expression = 'SET Labels = :labels, TextFromLabels = :from_labels'
+        values = {':labels': labels, ':from_labels': False}
+    else:
+        # No text in the image, describe it by its labels instead
+        summary = ', '.join(labels[:5])  # Top 5 labels
+        plaintext = summary if summary else 'No objects detected'
+        word_count = len(plaintext.split())
+        update_expression = 'SET Plaintext = :plaintext, Labels = :labels, WordCount = :word_count, TextFromLabels = :from_labels'
+        values = {':plaintext': plaintext, ':labels': labels, ':word_count': word_count, ':from_labels': True}
+
+    # A failed label detection leaves the stage unversioned so reprocessing retries it
+    if 'error' not in labels_result:
+        update_expression, values = pipeline.stamp('labels', update_expression, values)
+
+    pipeline.update_item(
+        table, event,
+        Key={'Name': key, 'Bucket': bucket},
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=values
+    )
+
+    return {
+        'bucket': bucket,
+        'key': key,
+        'wordCount': word_count,
+        **pipeline.context(event)
+    }
@@ -0,0 +1,219 @@
+import boto3
+import os
+import struct
+from io import BytesIO
+
+from src import pipeline, profiling
+
+s3 = boto3.client('s3')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+
+DERIVATIVE_BUCKET = os.environ.get('DERIVATIVE_BUCKET_NAME')
+ANALYSIS_MAX_EDGE = int(os.environ.get('ANALYSIS_MAX_EDGE', '2048'))
+ANALYSIS_MAX_BYTES = int(os.environ.get('ANALYSIS_MAX_BYTES', str(5 * 1024 * 1024)))
+THUMBNAIL_MAX_EDGE = int(os.environ.get('THUMBNAIL_MAX_EDGE', '256'))
+
+# Enough to cover the image header and the EXIF block of camera JPEGs
+HEADER_BYTES = 64 * 1024
+
+# SOFn markers carrying the frame size (C4, C8 and CC are not frames)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+@profiling.profiled
+def lambda_handler(event, context):
+    bucket = event['bucket']
+    key = event['key']
+
+    # Fall back to analysing the original whenever no derivative is made
+    analysis_object = {'bucket': bucket, 'key': key}
+    thumbnail_key = None
+
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{HEADER_BYTES - 1}')
+        header = response['Body'].read()
+        total_size = parse_total_size(response.get('ContentRange'), len(header))
+
+        image_format, dimensions = read_image_info(header)
+        print(f"Image {key}: format={image_format}, dimensions={dimensions}, size={total_size}")
+
+        # Multi-page TIFFs stay on the original, a JPEG derivative would drop pages
+        needs_analysis_copy = image_format in ('png', 'jpeg') and (
+            total_size > ANALYSIS_MAX_BYTES
+            or (dimensions is not None and max(dimensions) > ANALYSIS_MAX_EDGE)
+        )
+
+        image_module = load_image_library()
+        if image_module is not None:
+            content = header if total_size <= len(header) else s3.get_object(Bucket=bucket, Key=key)['Body'].read()
+
+            if needs_analysis_copy:
+                analysis_key = f'analysis/{key}.jpg'
+                put_derivative(analysis_key, resize_image(image_module, content, ANALYSIS_MAX_EDGE, 90))
+                analysis_object = {'bucket': DERIVATIVE_BUCKET, 'key': analysis_key}
+
+            thumbnail_key = f'thumbnails/{key}.jpg'
+            put_derivative(thumbnail_key, resize_image(image_module, content, THUMBNAIL_MAX_EDGE, 75))
+        elif image_format == 'jpeg':
+            # Pure-Python path: reuse the thumbnail cameras embed in the EXIF block
+            thumbnail = extract_exif_thumbnail(header)
+            if thumbnail:
+                thumbnail_key = f'thumbnails/{key}.jpg'
+                put_derivative(thumbnail_key, thumbnail)
+
+        # Reprocessing reruns image stages on the stored analysis object
+        update_expression = 'SET AnalysisObject = :analysis_object'
+        values = {':analysis_object': analysis_object}
+        if thumbnail_key:
+            update_expression += ', ThumbnailKey = :thumbnail_key'
+            values[':thumbnail_key'] = thumbnail_key
+        pipeline.update_item(
+            table, event,
+            Key={'Name': key, 'Bucket': bucket},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+
+    except pipeline.Superseded:
+        raise
+    except Exception as e:
+        print(f"Error preparing image {key}: {str(e)}")
+
+    return {
+        'bucket': bucket,
+        'key': key,
+        'analysisObject': analysis_object,
+        'thumbnailKey': thumbnail_key
+    }
+
+def load_image_library():
+    """Return PIL.Image if Pillow is available (via a layer), otherwise None"""
+    try:
+        from PIL import Image
+        return Image
+    except ImportError:
+        return None
+
+def resize_image(image_module, content, max_edge, quality):
+    """Downscale an image so its longest edge is at most max_edge and encode it as JPEG"""
+    from PIL import ImageOps
+
+    with image_module.open(BytesIO(content)) as image:
+        # Let the JPEG decoder scale down while decoding to keep memory low
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge))
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+        return output.getvalue()
+
+def put_derivative(derivative_key, body):
+    s3.put_object(
+        Bucket=DERIVATIVE_BUCKET,
+        Key=derivative_key,
+        Body=body,
+        ContentType='image/jpeg'
+    )
+    print(f"Stored derivative {derivative_key} ({len(body)} bytes)")
+
+def parse_total_size(content_range, default):
+    """Get the object size from a 'bytes 0-65535/1234567' Content-Range header"""
+    if content_range and '/' in content_range:
+        total = content_range.rsplit('/', 1)[1]
+        if total.isdigit():
+            return int(total)
+    return default
+
+def read_image_info(header):
+    """Return (format, (width, height)) from the first bytes of an image file"""
+    if header.startswith(b'\x89PNG\r\n\x1a\n') and len(header) >= 24:
+        width, height = struct.unpack('>II', header[16:24])
+        return 'png', (width, height)
+
+    if header.startswith(b'\xff\xd8'):
+        return 'jpeg', read_jpeg_dimensions(header)
+
+    if header[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff', None
+
+    return 'unknown', None
+
+def read_jpeg_dimensions(header):
+    """Walk the JPEG marker segments up to the first frame header"""
+    offset = 2
+    while offset + 4 <= len(header):
+        if header[offset] != 0xFF:
+            return None
+        marker = header[offset + 1]
+        # Fill bytes and standalone markers have no length field
+        if marker == 0xFF:
+            offset += 1
+            continue
+        if marker in (0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7):
+            offset += 2
+            continue
+
+        segment_length = struct.unpack('>H', header[offset + 2:offset + 4])[0]
+        if marker in JPEG_SOF_MARKERS:
+            if offset + 9 > len(header):
+                return None
+            height, width = struct.unpack('>HH', header[offset + 5:offset + 9])
+            return width, height
+
+        offset += 2 + segment_length
+    return None
+
+def extract_exif_thumbnail(header):
+    """Return the JPEG thumbnail embedded in IFD1 of the EXIF block, if there is one"""
+    offset = 2
+    while offset + 4 <= len(header) and header[offset] == 0xFF:
+        marker = header[offset + 1]
+        segment_length = struct.unpack('>H', header[offset + 2:offset + 4])[0]
+        segment = header[offset + 4:offset + 2 + segment_length]
+
+        if marker == 0xE1 and segment.startswith(b'Exif\x00\x00'):
+            return read_ifd1_thumbnail(segment[6:])
+        # EXIF always comes before the image data
+        if marker in JPEG_SOF_MARKERS or marker == 0xDA:
+            return None
+
+        offset += 2 + segment_length
+    return None
+
+def read_ifd1_thumbnail(tiff):
+    """Follow the TIFF structure of an EXIF block to the IFD1 thumbnail bytes"""
+    if len(tiff) < 8 or tiff[:2] not in (b'II', b'MM'):
+        return None
+    endian = '<' if tiff[:2] == b'II' else '>'
+
+    def read_ifd(ifd_offset):
+        if ifd_offset + 2 > len(tiff):
+            return {}, 0
+        count = struct.unpack(endian + 'H', tiff[ifd_offset:ifd_offset + 2])[0]
+        entries = {}
+        for i in range(count):
+            entry = ifd_offset + 2 + i * 12
+            if entry + 12 > len(tiff):
+                break
+            tag, _, _, value = struct.unpack(endian + 'HHII', tiff[entry:entry + 12])
+            entries[tag] = value
+        next_offset_pos = ifd_offset + 2 + count * 12
+        if next_offset_pos + 4 > len(tiff):
+            return entries, 0
+        return entries, struct.unpack(endian + 'I', tiff[next_offset_pos:next_offset_pos + 4])[0]
+
+    _, ifd1_offset = read_ifd(struct.unpack(endian + 'I', tiff[4:8])[0])
+    if not ifd1_offset:
+        return None
+
+    ifd1, _ = read_ifd(ifd1_offset)
+    # JPEGInterchangeFormat / JPEGInterchangeFormatLength
+    start, length = ifd1.get(0x0201), ifd1.get(0x0202)
+    if not start or not length or start + length > len(tiff):
+        return None
+
+    thumbnail = tiff[start:start + length]
+    return thumbnail if thumbnail.startswith(b'\xff\xd8') else None
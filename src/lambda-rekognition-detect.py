@@ -2,57 +2,88 @@ import json
 import boto3
 import os
 
+from src import pipeline, profiling
+
 rekognition = boto3.client('rekognition')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
 
+@profiling.profiled
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
     
+    # Label detection runs on the downscaled copy when there is one
+    analysis_object = event.get('analysisObject') or {'bucket': bucket, 'key': key}
+    
+    # In 'labels' mode (parallel image analysis) only return the labels;
+    # the merge step decides what ends up in Plaintext
+    if event.get('mode') == 'labels':
+        return {
+            'bucket': bucket,
+            'key': key,
+            'labels': detect_labels(analysis_object['bucket'], analysis_object['key'])
+        }
+    
     try:
-        response = rekognition.detect_labels(
-            Image={
-                'S3Object': {
-                    'Bucket': bucket,
-                    'Name': key
-                }
-            },
-            MaxLabels=10,
-            MinConfidence=70
-        )
-        
-        # Extract labels and create summary
-        labels = [label['Name'] for label in response['Labels']]
+        labels = detect_labels(analysis_object['bucket'], analysis_object['key'])
+
         summary = ', '.join(labels[:5])  # Top 5 labels
         
         # Store plaintext in DynamoDB immediately
         plaintext = summary if summary else 'No objects detected'
-        table.update_item(
-            Key={'Name': key, 'Bucket': bucket},
-            UpdateExpression='SET Plaintext = :plaintext',
-            ExpressionAttributeValues={':plaintext': plaintext}
-        )
         
         # Calculate word count
         word_count = len(plaintext.split()) if plaintext else 0
         
+        update_expression, values = pipeline.stamp(
+            'labels',
+            'SET Plaintext = :plaintext, Labels = :labels, WordCount = :word_count, TextFromLabels = :from_labels',
+            {':plaintext': plaintext, ':labels': labels, ':word_count': word_count, ':from_labels': True}
+        )
+        pipeline.update_item(
+            table, event,
+            Key={'Name': key, 'Bucket': bucket},
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
+        )
+        
         return {
             'bucket': bucket,
             'key': key,
-            'wordCount': word_count
+            'wordCount': word_count,
+            **pipeline.context(event)
         }
         
+    except pipeline.Superseded:
+        raise
     except Exception as e:
         error_msg = f'Error detecting objects: {str(e)}'
-        table.update_item(
+        pipeline.update_item(
+            table, event,
             Key={'Name': key, 'Bucket': bucket},
-            UpdateExpression='SET Plaintext = :plaintext',
-            ExpressionAttributeValues={':plaintext': error_msg}
+            UpdateExpression='SET Plaintext = :plaintext, TextFromLabels = :from_labels',
+            ExpressionAttributeValues={':plaintext': error_msg, ':from_labels': True}
         )
         
         return {
             'bucket': bucket,
             'key': key,
-            'wordCount': 0
-        }
\ No newline at end of file
+            'wordCount': 0,
+            **pipeline.context(event)
+        }
+
+def detect_labels(bucket, key):
+    """Return the names of the labels Rekognition detects in the image"""
+    response = rekognition.detect_labels(
+        Image={
+            'S3Object': {
+                'Bucket': bucket,
+                'Name': key
+            }
+        },
+        MaxLabels=10,
+        MinConfidence=70
+    )
+    
+    return [label['Name'] for label in response['Labels']]
@@ -0,0 +1,215 @@
+import json
+import boto3
+import hashlib
+import os
+import time
+from datetime import datetime
+
+from src import pipeline, profiling
+from src.extractors.sniff import MIME_FORMATS
+
+lambda_client = boto3.client('lambda')
+stepfunctions = boto3.client('stepfunctions')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+
+STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN')
+IMAGE_ANALYSIS_MODE = os.environ.get('IMAGE_ANALYSIS_MODE', 'parallel')
+
+# Pace the executions so a large corpus does not flood Textract and Comprehend
+STARTS_PER_SECOND = float(os.environ.get('REPROCESS_STARTS_PER_SECOND', '20'))
+
+# Hand over to a fresh invocation before the Lambda timeout hits
+MIN_REMAINING_MS = 60 * 1000
+MAX_RETRIES = 8
+
+# Images Rekognition reads, TIFFs only get OCR
+LABELED_MIME_TYPES = {'image/png', 'image/jpeg'}
+LABELED_EXTENSIONS = {'png', 'jpg', 'jpeg'}
+OCR_MIME_TYPES = {'application/pdf', 'image/tiff'}
+OCR_EXTENSIONS = {'pdf', 'tif', 'tiff'}
+
+# The Plaintext of images without text, see lambda-merge-image-analysis
+NO_LABELS_TEXT = 'No objects detected'
+
+# What reprocess_plan and start_execution read of an item, Plaintext can be up to
+# pipeline.MAX_PLAINTEXT_BYTES and is never needed
+SCAN_ATTRIBUTES = [
+    'Name', 'Bucket', *pipeline.STAGE_ATTRIBUTES.values(), 'WordCount', 'Labels', 'TextFromLabels',
+    'SourceETag', 'SourceVersionId', 'SourceSequencer', 'FileType', 'MimeType', 'AnalysisObject'
+]
+
+@profiling.profiled
+def lambda_handler(event, context):
+    """Rerun the stages of stored documents whose version is behind pipeline.STAGE_VERSIONS.
+
+    Event: {jobId, stages (default all), prefix (optional), exclusiveStartKey (when continuing)}
+    """
+    job_id = event['jobId']
+    stages = event.get('stages') or list(pipeline.STAGE_VERSIONS)
+    print(f"Running reprocess job {job_id} for stages {stages}")
+    update_job(job_id, 'RUNNING')
+
+    try:
+        # Attribute names like Name and Bucket are reserved words
+        names = {f'#a{index}': attribute for index, attribute in enumerate(SCAN_ATTRIBUTES)}
+        scan_kwargs = {
+            'ProjectionExpression': ', '.join(names),
+            'ExpressionAttributeNames': names
+        }
+        if event.get('prefix'):
+            scan_kwargs['FilterExpression'] = 'begins_with(#n, :prefix)'
+            scan_kwargs['ExpressionAttributeNames'] = {**names, '#n': 'Name'}
+            scan_kwargs['ExpressionAttributeValues'] = {':prefix': event['prefix']}
+        if event.get('exclusiveStartKey'):
+            scan_kwargs['ExclusiveStartKey'] = event['exclusiveStartKey']
+
+        while True:
+            response = table.scan(**scan_kwargs)
+            started = skipped = 0
+            for item in response['Items']:
+                plan = reprocess_plan(item, stages)
+                if plan is None:
+                    skipped += 1
+                    continue
+                start_execution(job_id, item, plan)
+                started += 1
+                time.sleep(1 / STARTS_PER_SECOND)
+            record_progress(job_id, started, skipped)
+
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+            if context and context.get_remaining_time_in_millis() < MIN_REMAINING_MS:
+                continue_in_new_invocation(event, response['LastEvaluatedKey'], context)
+                return {'jobId': job_id, 'status': 'CONTINUED'}
+
+        update_job(job_id, 'SUCCEEDED')
+        return {'jobId': job_id, 'status': 'SUCCEEDED'}
+
+    except Exception as e:
+        print(f"Reprocess job {job_id} failed: {str(e)}")
+        update_job(job_id, 'FAILED', error=str(e))
+        return {'jobId': job_id, 'status': 'FAILED', 'error': str(e)}
+
+def content_stages(item):
+    """The content stages the workflow runs for the item's type, by its sniffed type or,
+    for older items, its extension"""
+    mime_type = item.get('MimeType')
+    file_type = item.get('FileType', '')
+    if not mime_type and not file_type:
+        # Not even its metadata stored, go by the stages that stamped it
+        present = [stage for stage in pipeline.CONTENT_STAGES if pipeline.STAGE_ATTRIBUTES[stage] in item]
+        return present or ['extract']
+    if mime_type in LABELED_MIME_TYPES or (not mime_type and file_type in LABELED_EXTENSIONS):
+        # Sequential image analysis only detects labels when OCR found no text
+        if IMAGE_ANALYSIS_MODE == 'parallel' or 'Labels' in item:
+            return ['ocr', 'labels']
+        return ['ocr']
+    if mime_type in OCR_MIME_TYPES or (not mime_type and file_type in OCR_EXTENSIONS):
+        return ['ocr']
+    if not mime_type or mime_type in MIME_FORMATS:
+        return ['extract']
+    # Unsupported content has no content stage to rerun
+    return []
+
+def is_stale(item, stage):
+    """A stage is stale when its version is behind, or it never stamped the item (e.g. it failed)"""
+    return int(item.get(pipeline.STAGE_ATTRIBUTES[stage], 0)) < pipeline.STAGE_VERSIONS[stage]
+
+def reprocess_plan(item, stages):
+    """Which parts of the workflow to rerun for an item, or None when it is up to date"""
+    expected = content_stages(item)
+    plan = {stage: stage in expected and stage in stages and is_stale(item, stage) for stage in pipeline.CONTENT_STAGES}
+    # New text means a new summary, so a content stage always runs the summary too
+    plan['summary'] = any(plan.values()) or ('summary' in stages and is_stale(item, 'summary'))
+    plan['metadata'] = 'metadata' in stages and is_stale(item, 'metadata')
+    return plan if any(plan.values()) else None
+
+def text_word_count(item, word_count):
+    """Words of the item's own text, 0 when its Plaintext only describes its labels"""
+    if 'TextFromLabels' in item:
+        return 0 if item['TextFromLabels'] else word_count
+    # Items stored before TextFromLabels, the label text has as many words as the summary of the labels
+    labels = item.get('Labels')
+    if labels is not None and word_count == len((', '.join(labels[:5]) or NO_LABELS_TEXT).split()):
+        return 0
+    return word_count
+
+def start_execution(job_id, item, plan):
+    key = item['Name']
+    bucket = item['Bucket']
+
+    # Derived stages start from the stored text instead of the file
+    word_count = item.get('WordCount', 0)
+
+    execution_input = {
+        'bucket': bucket,
+        'key': key,
+        'wordCount': int(word_count),
+        'imageAnalysisMode': IMAGE_ANALYSIS_MODE,
+        'reprocess': plan,
+        # A labels rerun keeps the stored text when the image has some
+        'textWordCount': text_word_count(item, int(word_count)),
+        # A rerun over the corpus must not hold up new uploads
+        'priority': 'bulk',
+        # Guard the writes like the execution that produced the item, a newer upload wins
+        'source': {
+            'etag': item.get('SourceETag'),
+            'versionId': item.get('SourceVersionId'),
+            'sequencer': item['SourceSequencer']
+        } if item.get('SourceSequencer') else None
+    }
+
+    # Image stages rerun on the image prepare-image picked before, without preparing it again
+    if item.get('AnalysisObject'):
+        execution_input['analysisObject'] = item['AnalysisObject']
+
+    # One execution per item and job, so a retried scan page does not start it twice
+    name = 'reprocess-' + hashlib.sha256(f"{job_id}\n{bucket}/{key}".encode('utf-8')).hexdigest()[:64]
+    for attempt in range(MAX_RETRIES):
+        try:
+            stepfunctions.start_execution(stateMachineArn=STATE_MACHINE_ARN, name=name, input=json.dumps(execution_input))
+            return
+        except stepfunctions.exceptions.ExecutionAlreadyExists:
+            return
+        except stepfunctions.exceptions.ClientError as e:
+            if e.response['Error']['Code'] != 'ThrottlingException' or attempt == MAX_RETRIES - 1:
+                raise
+            time.sleep(min(0.1 * 2 ** attempt, 5))
+
+def continue_in_new_invocation(event, exclusive_start_key, context):
+    next_event = {**event, 'exclusiveStartKey': exclusive_start_key}
+    print(f"Continuing job {event['jobId']} in a new invocation from {exclusive_start_key}")
+    lambda_client.invoke(
+        FunctionName=context.function_name,
+        InvocationType='Event',
+        Payload=json.dumps(next_event)
+    )
+
+def record_progress(job_id, started, skipped):
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression='ADD Started :started, Skipped :skipped SET UpdatedAt = :now',
+        ExpressionAttributeValues={
+            ':started': started,
+            ':skipped': skipped,
+            ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')
+        }
+    )
+
+def update_job(job_id, status, error=None):
+    expression = 'SET #status = :status, UpdatedAt = :now'
+    values = {':status': status, ':now': datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%S.%fZ')}
+    if error:
+        expression += ', JobError = :error'
+        values[':error'] = error
+
+    job_table.update_item(
+        Key={'JobId': job_id},
+        UpdateExpression=expression,
+        ExpressionAttributeNames={'#status': 'Status'},
+        ExpressionAttributeValues=values
+    )
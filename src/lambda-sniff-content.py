@@ -0,0 +1,38 @@
+import json
+import boto3
+import mimetypes
+from botocore.exceptions import ClientError
+
+from src import extractors, profiling
+from src.extractors.sniff import SNIFF_BYTES, sniff
+
+s3 = boto3.client('s3')
+
+@profiling.profiled
+def lambda_handler(event, context):
+    bucket = event['bucket']
+    key = event['key']
+
+    try:
+        # Only the first few KB are needed to tell the real type and encoding
+        try:
+            response = s3.get_object(Bucket=bucket, Key=key, Range=f'bytes=0-{SNIFF_BYTES - 1}')
+            head = response['Body'].read()
+        except ClientError as e:
+            # Ranged GETs on empty objects are rejected
+            if e.response['Error']['Code'] != 'InvalidRange':
+                raise
+            head = b''
+
+        content = sniff(head, key)
+
+    except Exception as e:
+        print(f"Error sniffing {key}, falling back to the extension: {str(e)}")
+        content = {
+            'mimeType': mimetypes.guess_type(key)[0] or 'application/octet-stream',
+            'encoding': None,
+            'format': extractors.format_from_extension(key)
+        }
+
+    print(f"Sniffed {key}: {json.dumps(content)}")
+    return content
@@ -1,31 +1,79 @@
 import json
 import boto3
 import os
+from botocore.exceptions import ClientError
+
+from src import lanes, pipeline, profiling
 
 textract = boto3.client('textract')
 sqs = boto3.client('sqs')
+dynamodb = boto3.resource('dynamodb')
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+
+# Polling queue of each lane, the state machine sends the job there
+QUEUE_URLS = {
+    'interactive': os.environ.get('SQS_QUEUE_URL'),
+    'bulk': os.environ.get('BULK_SQS_QUEUE_URL'),
+}
+
+# Textract jobs bulk executions may run at once, 0 for no limit
+BULK_TEXTRACT_JOBS = int(os.environ.get('BULK_TEXTRACT_JOBS', '20'))
+
+# Textract's answers when its transaction or concurrent job quota is reached
+THROTTLING_ERRORS = ('LimitExceededException', 'ProvisionedThroughputExceededException', 'ThrottlingException')
 
+class TextractThrottled(Exception):
+    """Textract refused the job for now, the state machine retries with backoff"""
+
+@profiling.profiled
 def lambda_handler(event, context):
+    # Waiting for the job failed, the state machine gives its slot back (the Catch of WaitForTextract)
+    if event.get('mode') == 'release':
+        started = event.get('started') or {}
+        if started.get('priority') == 'bulk' and started.get('jobId'):
+            lanes.release_slot(job_table, lanes.BULK_TEXTRACT_LANE, started['jobId'])
+        return {}
+    
     bucket = event['bucket']
     key = event['key']
     
+    # Images may come with a downscaled copy to run OCR on instead
+    analysis_object = event.get('analysisObject') or {'bucket': bucket, 'key': key}
+    
+    priority = lanes.priority_of(event)
+    lease_id = None
+    if priority == 'bulk' and BULK_TEXTRACT_JOBS > 0:
+        # Raises LaneBusy, the job starts on a later attempt
+        lease_id = lanes.acquire_slot(job_table, lanes.BULK_TEXTRACT_LANE, BULK_TEXTRACT_JOBS)
+    
     try:
         response = textract.start_document_text_detection(
             DocumentLocation={
                 'S3Object': {
-                    'Bucket': bucket,
-                    'Name': key
+                    'Bucket': analysis_object['bucket'],
+                    'Name': analysis_object['key']
                 }
             }
         )
         
         job_id = response['JobId']
+        if lease_id:
+            lanes.assign_slot(job_table, lanes.BULK_TEXTRACT_LANE, lease_id, job_id)
         
         return {
             'jobId': job_id,
             'bucket': bucket,
-            'key': key
+            'key': key,
+            'analysisObject': analysis_object,
+            **pipeline.context(event),
+            # Always set, the poller's message carries it
+            'priority': priority,
+            'queueUrl': QUEUE_URLS[priority]
         }
         
     except Exception as e:
-        return {'error': str(e)}
\ No newline at end of file
+        if lease_id:
+            lanes.release_slot(job_table, lanes.BULK_TEXTRACT_LANE, lease_id)
+        if isinstance(e, ClientError) and e.response['Error']['Code'] in THROTTLING_ERRORS:
+            raise TextractThrottled(str(e))
+        return {'error': str(e)}
@@ -0,0 +1,118 @@
+import json
+import boto3
+import hashlib
+import os
+import re
+from botocore.exceptions import ClientError
+
+from src import lanes, pipeline, profiling
+
+s3 = boto3.client('s3')
+stepfunctions = boto3.client('stepfunctions')
+dynamodb = boto3.resource('dynamodb')
+table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+
+STATE_MACHINE_ARN = os.environ.get('STATE_MACHINE_ARN')
+IMAGE_ANALYSIS_MODE = os.environ.get('IMAGE_ANALYSIS_MODE', 'parallel')
+
+# Objects under these prefixes are bulk work unless tagged otherwise, see src/lanes.py
+BULK_PREFIXES = [prefix for prefix in os.environ.get('BULK_PREFIXES', '').split(',') if prefix]
+DEFAULT_PRIORITY = os.environ.get('DEFAULT_PRIORITY', lanes.DEFAULT_PRIORITY)
+
+@profiling.profiled
+def lambda_handler(event, context):
+    """Start one workflow execution per object version from a batch of S3 Object Created events.
+
+    Events for the same key are coalesced to the latest write, and an event is
+    dropped when the object was overwritten since, its successor's event starts
+    the pipeline instead.
+    """
+    latest = {}
+    message_ids = {}
+    for record in event['Records']:
+        detail = json.loads(record['body'])['detail']
+        bucket = detail['bucket']['name']
+        key = detail['object']['key']
+        source = {
+            'etag': detail['object'].get('etag'),
+            'versionId': detail['object'].get('version-id'),
+            'sequencer': pipeline.normalize_sequencer(detail['object'].get('sequencer'))
+        }
+
+        message_ids.setdefault((bucket, key), []).append(record['messageId'])
+        if (bucket, key) not in latest or source['sequencer'] > latest[(bucket, key)]['sequencer']:
+            latest[(bucket, key)] = source
+
+    print(f"Coalesced {len(event['Records'])} events into {len(latest)} objects")
+
+    failures = []
+    for (bucket, key), source in latest.items():
+        try:
+            start_workflow(bucket, key, source)
+        except Exception as e:
+            print(f"Error starting workflow for {key}: {str(e)}")
+            failures.extend({'itemIdentifier': message_id} for message_id in message_ids[(bucket, key)])
+
+    return {'batchItemFailures': failures}
+
+def start_workflow(bucket, key, source):
+    # The object may have been overwritten or deleted while the event waited in the queue
+    try:
+        head = s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        # S3 only answers 404 with s3:ListBucket on the bucket, 403 otherwise
+        if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+            print(f"Skipping {key}, it was deleted")
+            return
+        raise
+
+    current = {'etag': head['ETag'].strip('"'), 'versionId': head.get('VersionId')}
+    if (source['etag'] and current['etag'] != source['etag']) or (source['versionId'] and current['versionId'] != source['versionId']):
+        print(f"Skipping {key} version {source['versionId'] or source['etag']}, it was overwritten")
+        return
+
+    tags = object_tags(bucket, key, head)
+    if tags.get(pipeline.MOVED_TAG) == 'true' and pipeline.claim(
+            table, bucket, key, source, condition=f'attribute_exists({pipeline.MOVED_FROM_ATTRIBUTE})'):
+        # Copied by a bulk move, its item already holds the results
+        print(f"Skipping {key}, it was moved with its processing results")
+        return
+
+    if not pipeline.claim(table, bucket, key, source):
+        print(f"Skipping {key} sequencer {source['sequencer']}, a later version claimed it")
+        return
+
+    priority = lanes.classify(key, tags, head.get('Metadata') or {}, BULK_PREFIXES, DEFAULT_PRIORITY)
+
+    try:
+        stepfunctions.start_execution(
+            stateMachineArn=STATE_MACHINE_ARN,
+            name=execution_name(bucket, key, source),
+            input=json.dumps({
+                'bucket': bucket,
+                'key': key,
+                'source': source,
+                'imageAnalysisMode': IMAGE_ANALYSIS_MODE,
+                'priority': priority
+            })
+        )
+        print(f"Started {priority} workflow for {key} sequencer {source['sequencer']}")
+    except stepfunctions.exceptions.ExecutionAlreadyExists:
+        # Redelivered event, the execution for this version is already running or done
+        print(f"Workflow for {key} sequencer {source['sequencer']} already started")
+
+def object_tags(bucket, key, head):
+    """The object's tags, they are only read when it has some"""
+    if not head.get('TagCount'):
+        return {}
+    tag_set = s3.get_object_tagging(Bucket=bucket, Key=key)['TagSet']
+    return {tag['Key']: tag['Value'] for tag in tag_set}
+
+def execution_name(bucket, key, source):
+    """Deterministic execution name for an object version, at most 80 characters.
+
+    The sequencer is part of it so re-uploading identical content (same ETag) is processed again.
+    """
+    identity = f"{bucket}/{key}\n{source['versionId'] or source['etag']}\n{source['sequencer']}"
+    readable = re.sub(r'[^A-Za-z0-9_-]', '-', key.rsplit('/', 1)[-1])[:15]
+    return f"{readable}-{hashlib.sha256(identity.encode('utf-8')).hexdigest()[:64]}"
@@ -3,9 +3,12 @@ import boto3
 import os
 import decimal
 
+from src import profiling
+
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
 
+@profiling.profiled
 def lambda_handler(event, context):
     # Handle error cases where bucket/key might not be available
     if 'bucket' in event and 'key' in event:
@@ -2,18 +2,41 @@ import json
 import boto3
 import os
 
+from src import lanes, pipeline, profiling, similarity
+
 textract = boto3.client('textract')
 sqs = boto3.client('sqs')
 stepfunctions = boto3.client('stepfunctions')
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
+index_table = dynamodb.Table(os.environ.get('SIMILARITY_INDEX_TABLE_NAME'))
+job_table = dynamodb.Table(os.environ.get('JOB_TABLE_NAME'))
+
+# Documents at least this similar (estimated Jaccard of their 5-word shingles) are near-duplicates
+DUPLICATE_THRESHOLD = float(os.environ.get('DUPLICATE_THRESHOLD', '0.9'))
+
+# Each lane's queue and how long its running jobs wait between status checks
+QUEUE_URLS = {
+    'interactive': os.environ.get('SQS_QUEUE_URL'),
+    'bulk': os.environ.get('BULK_SQS_QUEUE_URL'),
+}
+POLL_DELAY_SECONDS = {
+    'interactive': int(os.environ.get('INTERACTIVE_POLL_DELAY_SECONDS', '5')),
+    'bulk': int(os.environ.get('BULK_POLL_DELAY_SECONDS', '30')),
+}
+BULK_TEXTRACT_JOBS = int(os.environ.get('BULK_TEXTRACT_JOBS', '20'))
 
+@profiling.profiled
 def lambda_handler(event, context):
     for record in event['Records']:
         message = json.loads(record['body'])
         job_id = message['jobId']
         bucket = message['bucket']
         key = message['key']
+        priority = lanes.priority_of(message)
+        leased = priority == 'bulk' and BULK_TEXTRACT_JOBS > 0
+        # Whether the job is over for this execution, its lane slot is given back then
+        finished = True
         
         try:
             # Check job status
@@ -26,16 +49,36 @@ def lambda_handler(event, context):
                 for block in result.get('Blocks', []):
                     if block['BlockType'] == 'LINE':
                         plaintext += block['Text'] + '\n'
+                plaintext = pipeline.truncate_utf8(plaintext, pipeline.MAX_PLAINTEXT_BYTES)
+                
+                # Calculate word count
+                word_count = len(plaintext.strip().split()) if plaintext.strip() else 0
                 
                 # Store plaintext in DynamoDB immediately
-                table.update_item(
+                update_expression, values = pipeline.stamp(
+                    'ocr',
+                    'SET Plaintext = :plaintext, WordCount = :word_count, TextFromLabels = :from_labels',
+                    {':plaintext': plaintext.strip(), ':word_count': word_count, ':from_labels': False}
+                )
+                pipeline.update_item(
+                    table, message,
                     Key={'Name': key, 'Bucket': bucket},
-                    UpdateExpression='SET Plaintext = :plaintext',
-                    ExpressionAttributeValues={':plaintext': plaintext.strip()}
+                    UpdateExpression=update_expression,
+                    ExpressionAttributeValues=values
                 )
                 
-                # Calculate word count
-                word_count = len(plaintext.strip().split()) if plaintext.strip() else 0
+                if word_count:
+                    try:
+                        duplicate_of = similarity.index_document(
+                            dynamodb, table, index_table, bucket, key, plaintext, DUPLICATE_THRESHOLD,
+                            update_item=lambda **kwargs: pipeline.update_item(table, message, **kwargs)
+                        )
+                        if duplicate_of:
+                            print(f"{key} is a near-duplicate of {duplicate_of}")
+                    except pipeline.Superseded:
+                        raise
+                    except Exception as e:
+                        print(f"Error indexing {key} for similarity: {str(e)}")
                 
                 # Continue Step Functions workflow
                 stepfunctions.send_task_success(
@@ -43,7 +86,9 @@ def lambda_handler(event, context):
                     output=json.dumps({
                         'bucket': bucket,
                         'key': key,
-                        'wordCount': word_count
+                        'analysisObject': message.get('analysisObject') or {'bucket': bucket, 'key': key},
+                        'wordCount': word_count,
+                        **pipeline.context(message)
                     })
                 )
                 
@@ -57,14 +102,31 @@ def lambda_handler(event, context):
             else:
                 # Still processing, re-queue with delay
                 sqs.send_message(
-                    QueueUrl=os.environ['SQS_QUEUE_URL'],
+                    QueueUrl=QUEUE_URLS[priority],
                     MessageBody=record['body'],
-                    DelaySeconds=10
+                    DelaySeconds=POLL_DELAY_SECONDS[priority]
                 )
+                finished = False
+                if leased:
+                    try:
+                        lanes.renew_slot(job_table, lanes.BULK_TEXTRACT_LANE, job_id)
+                    except Exception as e:
+                        # The lease outlasts many missed renewals, the job goes on
+                        print(f"Error renewing the lease of Textract job {job_id}: {str(e)}")
                 
+        except pipeline.Superseded as e:
+            stepfunctions.send_task_failure(
+                taskToken=message.get('taskToken'),
+                error='Superseded',
+                cause=str(e)
+            )
         except Exception as e:
             stepfunctions.send_task_failure(
                 taskToken=message.get('taskToken'),
                 error='PollingError',
                 cause=str(e)
-            )
\ No newline at end of file
+            )
+        finally:
+            # Also when reporting to the execution failed, e.g. it was aborted or timed out
+            if finished and leased:
+                lanes.release_slot(job_table, lanes.BULK_TEXTRACT_LANE, job_id)
\ No newline at end of file
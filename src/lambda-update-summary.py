@@ -2,9 +2,12 @@ import json
 import boto3
 import os
 
+from src import pipeline, profiling
+
 dynamodb = boto3.resource('dynamodb')
 table = dynamodb.Table(os.environ.get('dynamoDBTableName'))
 
+@profiling.profiled
 def lambda_handler(event, context):
     bucket = event['bucket']
     key = event['key']
@@ -15,15 +18,15 @@ def lambda_handler(event, context):
         plaintext = response.get('Item', {}).get('Plaintext', 'Unsupported file type')
         
         # Update item with summary = plaintext
-        table.update_item(
+        update_expression, values = pipeline.stamp('summary', 'SET Summary = :summary', {':summary': plaintext})
+        pipeline.update_item(
+            table, event,
             Key={
                 'Name': key,
                 'Bucket': bucket
             },
-            UpdateExpression='SET Summary = :summary',
-            ExpressionAttributeValues={
-                ':summary': plaintext
-            }
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=values
         )
         
         return {
@@ -31,6 +34,8 @@ def lambda_handler(event, context):
             'message': 'Summary updated successfully'
         }
         
+    except pipeline.Superseded:
+        raise
     except Exception as e:
         return {
             'statusCode': 500,
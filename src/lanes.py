@@ -0,0 +1,154 @@
+"""Priority lanes, so interactive uploads are not stuck behind bulk backfills.
+
+Every execution has a priority, 'interactive' or 'bulk', passed on with the
+execution context (pipeline.CONTEXT_FIELDS). lambda-start-workflow classifies
+uploads, lambda-reprocess starts its executions as bulk. Bulk executions then
+run in their own lane in the stages that wait for shared capacity:
+
+- Textract: a bulk execution holds one of BULK_TEXTRACT_JOBS slots while its job
+  runs, so bulk work never takes the whole concurrent job quota. Without a free
+  slot lambda-start-detect-document-text-textract raises LaneBusy and the state
+  machine retries later. Each lane has its own polling queue and poller
+  concurrency.
+- summaries: bulk executions call their own summarizer functions, whose
+  reserved concurrency is the bulk budget.
+
+Slots are leases in a JobTable item per lane (JobId 'lane#<name>'), whose Leases
+map holds the Textract JobId of every job in the lane with the time its lease
+expires. The poller renews a job's lease at every status check and gives it
+back once the job is over, as does the state machine when waiting for the job
+fails. Executions that are aborted or time out never give theirs back, their
+leases expire and acquire_slot drops them when the lane looks full.
+"""
+import time
+import uuid
+
+from botocore.exceptions import ClientError
+
+PRIORITIES = ('interactive', 'bulk')
+DEFAULT_PRIORITY = 'interactive'
+
+# Object tag, and user metadata set by the upload routes, that name an object's priority
+PRIORITY_KEY = 'priority'
+
+# Slots of bulk executions with a Textract job running
+BULK_TEXTRACT_LANE = 'bulk-textract'
+
+# A lease not renewed for this long is taken to be abandoned, well above the poll delays
+LEASE_SECONDS = 15 * 60
+
+class LaneBusy(Exception):
+    """All slots of the lane are taken, the state machine retries later"""
+
+def priority_of(event):
+    """The execution's priority, executions started without a known one are interactive"""
+    priority = event.get('priority')
+    return priority if priority in PRIORITIES else DEFAULT_PRIORITY
+
+def classify(key, tags, metadata, bulk_prefixes, default=DEFAULT_PRIORITY):
+    """Priority of an uploaded object: its priority tag, the priority its upload route
+    stored in its metadata, then bulk if its key starts with one of bulk_prefixes"""
+    for value in (tags.get(PRIORITY_KEY), metadata.get(PRIORITY_KEY)):
+        if value in PRIORITIES:
+            return value
+    if any(key.startswith(prefix) for prefix in bulk_prefixes):
+        return 'bulk'
+    return default
+
+def acquire_slot(table, lane, limit):
+    """Take one of the lane's limit slots, raises LaneBusy when all are taken.
+
+    Returns the lease's provisional id, assign_slot names it after the job.
+    """
+    lease_id = f'pending-{uuid.uuid4().hex}'
+    if not _add_lease(table, lane, lease_id, limit):
+        # Full, unless some of the leases were abandoned
+        if not _drop_expired(table, lane) or not _add_lease(table, lane, lease_id, limit):
+            raise LaneBusy(f'All {limit} {lane} slots are in use')
+    return lease_id
+
+def assign_slot(table, lane, lease_id, job_id):
+    """Move a provisional lease to the job it was taken for"""
+    table.update_item(
+        Key={'JobId': f'lane#{lane}'},
+        UpdateExpression='REMOVE Leases.#lease SET Leases.#job = :expires',
+        ExpressionAttributeNames={'#lease': lease_id, '#job': job_id},
+        ExpressionAttributeValues={':expires': int(time.time()) + LEASE_SECONDS}
+    )
+
+def renew_slot(table, lane, job_id):
+    """Extend a running job's lease, a lease that was given back or dropped stays gone"""
+    _update_lease(table, lane, job_id, 'SET Leases.#lease = :expires', {':expires': int(time.time()) + LEASE_SECONDS})
+
+def release_slot(table, lane, job_id):
+    """Give a job's slot back, releasing it twice is harmless"""
+    _update_lease(table, lane, job_id, 'REMOVE Leases.#lease')
+
+def _update_lease(table, lane, lease_id, update_expression, values=None):
+    kwargs = {'ExpressionAttributeValues': values} if values else {}
+    try:
+        table.update_item(
+            Key={'JobId': f'lane#{lane}'},
+            UpdateExpression=update_expression,
+            ConditionExpression='attribute_exists(Leases.#lease)',
+            ExpressionAttributeNames={'#lease': lease_id},
+            **kwargs
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+def _add_lease(table, lane, lease_id, limit):
+    """Add a lease when the lane has a free slot, returns False when it has none"""
+    try:
+        table.update_item(
+            Key={'JobId': f'lane#{lane}'},
+            UpdateExpression='SET Leases.#lease = :expires',
+            ConditionExpression='attribute_exists(Leases) AND size(Leases) < :limit',
+            ExpressionAttributeNames={'#lease': lease_id},
+            ExpressionAttributeValues={':expires': int(time.time()) + LEASE_SECONDS, ':limit': limit}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+    # The first lease of a lane creates its item
+    try:
+        table.update_item(
+            Key={'JobId': f'lane#{lane}'},
+            UpdateExpression='SET Leases = :leases',
+            ConditionExpression='attribute_not_exists(Leases)',
+            ExpressionAttributeValues={':leases': {lease_id: int(time.time()) + LEASE_SECONDS}}
+        )
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+
+def _drop_expired(table, lane):
+    """Remove the lane's expired leases, returns False when it has none"""
+    item = table.get_item(Key={'JobId': f'lane#{lane}'}, ConsistentRead=True).get('Item') or {}
+    now = time.time()
+    expired = [(lease_id, expires) for lease_id, expires in (item.get('Leases') or {}).items() if expires < now]
+    if not expired:
+        return False
+
+    names = {f'#lease{index}': lease_id for index, (lease_id, _) in enumerate(expired)}
+    values = {f':expires{index}': expires for index, (_, expires) in enumerate(expired)}
+    try:
+        # Only if none of them was renewed in the meantime
+        table.update_item(
+            Key={'JobId': f'lane#{lane}'},
+            UpdateExpression='REMOVE ' + ', '.join(f'Leases.{name}' for name in names),
+            ConditionExpression=' AND '.join(f'Leases.#lease{index} = :expires{index}' for index in range(len(expired))),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        return False
+    print(f"Dropped {len(expired)} expired {lane} leases")
+    return True
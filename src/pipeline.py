@@ -0,0 +1,138 @@
+"""Object version guard shared by the workflow Lambdas.
+
+lambda-start-workflow starts one execution per object version and gives it a
+'source' describing that version: {'etag', 'versionId', 'sequencer'}. Before
+starting, it claims the item by setting SourceSequencer, which only succeeds if
+no later version of the object claimed it first (S3 sequencers grow with every
+write to a key). Every write of the execution is then made conditional on
+SourceSequencer still being its own, so a pipeline for an overwritten version
+stops with Superseded instead of racing the pipeline for the current one.
+
+Executions without a source (started by hand) write unconditionally.
+
+Objects moved by lambda-bulk-operations are copied with the MOVED_TAG tag and
+their item is carried over with MOVED_FROM_ATTRIBUTE. lambda-start-workflow
+claims such an item for the copy without starting an execution, its stored
+results already describe the object.
+
+Each stage also stamps the item with the version of its logic (STAGE_VERSIONS),
+so lambda-reprocess can rerun only the stages whose logic changed since, and
+every write counts up ItemVersion, so readers holding a copy of the item (the
+API's read cache) can tell whether it is still current.
+"""
+from botocore.exceptions import ClientError
+
+# Fields of the execution input every Lambda passes on to the next state,
+# 'content' is the sniffed type (lambda-sniff-content)
+CONTEXT_FIELDS = ('source', 'imageAnalysisMode', 'priority', 'content')
+
+# Version of each stage's logic, bump it when a change should reach stored documents
+STAGE_VERSIONS = {
+    'extract': 1,   # text extraction from the file (lambda-extract-text)
+    'ocr': 1,       # Textract OCR (lambda-textract-poller)
+    'labels': 1,    # Rekognition labels (lambda-rekognition-detect, lambda-merge-image-analysis)
+    'summary': 1,   # summaries (lambda-local-summarize, lambda-comprehend-summarize, lambda-update-summary)
+    'metadata': 1,  # file metadata (lambda-extract-metadata)
+}
+
+# Item attribute holding the version that produced a stage's attributes
+STAGE_ATTRIBUTES = {stage: f'{stage.capitalize()}Version' for stage in STAGE_VERSIONS}
+
+# Stages that read the file itself, the rest only work from stored attributes
+CONTENT_STAGES = ('extract', 'ocr', 'labels')
+
+# Counted up by every write to an item
+ITEM_VERSION_ATTRIBUTE = 'ItemVersion'
+
+# DynamoDB items are limited to 400KB of UTF-8, Plaintext gets what is left once the
+# other attributes have their share: MinHash (512 bytes), Summary, Labels, the file
+# metadata and the attribute names
+MAX_ITEM_BYTES = 400 * 1024
+PLAINTEXT_HEADROOM_BYTES = 100 * 1024
+MAX_PLAINTEXT_BYTES = MAX_ITEM_BYTES - PLAINTEXT_HEADROOM_BYTES
+
+# Tag of objects copied by a bulk move, and the item attribute naming the key they were moved from
+MOVED_TAG = 'moved'
+MOVED_FROM_ATTRIBUTE = 'MovedFrom'
+
+# S3 sequencers are hex strings of varying length, padded to compare as strings
+SEQUENCER_WIDTH = 32
+
+class Superseded(Exception):
+    """A newer version of the object claimed the item, this execution must stop writing"""
+
+def normalize_sequencer(sequencer):
+    return (sequencer or '').upper().rjust(SEQUENCER_WIDTH, '0')
+
+def context(event):
+    """The execution context to include in a Lambda's output"""
+    passed = {field: event[field] for field in CONTEXT_FIELDS if field in event}
+    passed.setdefault('source', None)
+    return passed
+
+def stamp(stage, update_expression, values):
+    """Record the stage's version in a SET update expression and its values"""
+    placeholder = f':{stage}_version'
+    return (
+        f'{update_expression}, {STAGE_ATTRIBUTES[stage]} = {placeholder}',
+        {**values, placeholder: STAGE_VERSIONS[stage]}
+    )
+
+def truncate_utf8(text, max_bytes):
+    """Cut text to at most max_bytes of UTF-8 without splitting a character"""
+    data = text.encode('utf-8')
+    if len(data) <= max_bytes:
+        return text
+    return data[:max_bytes].decode('utf-8', errors='ignore')
+
+def versioned(**kwargs):
+    """Count the write in the item's ItemVersion, for update_item arguments"""
+    kwargs['UpdateExpression'] = f"{kwargs['UpdateExpression']} ADD {ITEM_VERSION_ATTRIBUTE} :item_version_step"
+    kwargs['ExpressionAttributeValues'] = {**kwargs.get('ExpressionAttributeValues', {}), ':item_version_step': 1}
+    return kwargs
+
+def guarded(event, **kwargs):
+    """Add the execution's object version guard to update_item/put_item arguments"""
+    sequencer = (event.get('source') or {}).get('sequencer')
+    if not sequencer:
+        return kwargs
+
+    condition = 'SourceSequencer = :source_sequencer'
+    if 'ConditionExpression' in kwargs:
+        condition = f"({kwargs['ConditionExpression']}) AND {condition}"
+    kwargs['ConditionExpression'] = condition
+    kwargs['ExpressionAttributeValues'] = {**kwargs.get('ExpressionAttributeValues', {}), ':source_sequencer': sequencer}
+    return kwargs
+
+def update_item(table, event, **kwargs):
+    """table.update_item guarded by the execution's object version, raises Superseded when it lost"""
+    try:
+        return table.update_item(**guarded(event, **versioned(**kwargs)))
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            raise Superseded(f"{kwargs['Key']['Name']} was claimed by a newer version of the object")
+        raise
+
+def claim(table, bucket, key, source, condition=None):
+    """Make an object version the one the item belongs to.
+
+    Returns False when a later version claimed the item already, or the item
+    does not meet the extra condition.
+    """
+    claimable = 'attribute_not_exists(SourceSequencer) OR SourceSequencer <= :sequencer'
+    try:
+        table.update_item(**versioned(
+            Key={'Name': key, 'Bucket': bucket},
+            UpdateExpression='SET SourceSequencer = :sequencer, SourceETag = :etag, SourceVersionId = :version_id',
+            ConditionExpression=f'({condition}) AND ({claimable})' if condition else claimable,
+            ExpressionAttributeValues={
+                ':sequencer': source['sequencer'],
+                ':etag': source.get('etag'),
+                ':version_id': source.get('versionId')
+            }
+        ))
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
@@ -0,0 +1,187 @@
+"""Opt-in profiling of the Lambda handlers.
+
+Every lambda_handler is wrapped with @profiling.profiled. With PROFILE_HANDLERS
+false (the default) the decorator returns the handler itself, invocations run
+exactly as without it. With it true, PROFILE_SAMPLE_RATE of the invocations
+(0.0 to 1.0) run under cProfile and tracemalloc, with every boto3 call timed
+through botocore's event hooks, and print one line when they end:
+
+    PROFILE {"handler":...,"durationMs":...,"functions":[...],"memory":{...},"aws":{...}}
+
+- functions: the PROFILE_TOP functions with the most time of their own, as
+  "file:line:function" with calls, own and cumulative milliseconds
+- memory: the tracemalloc peak, the largest allocation sites still held when the
+  handler returns, and the process's peak RSS (what the memory limit applies to)
+- aws: calls, total and slowest milliseconds, errors and retries per operation
+
+cProfile only sees the invocation's own thread, boto3 calls are counted from all
+threads. tracemalloc makes allocation heavy code several times slower, keep the
+sample rate low on busy functions.
+
+boto3 clients copy the session's event hooks when they are created, so this
+module has to be imported before the handler module creates its clients.
+
+The profilers are only imported once an invocation is sampled, so importing this
+module costs a cold start nothing more than reading the settings.
+"""
+import os
+import threading
+import time
+
+ENABLED = os.environ.get('PROFILE_HANDLERS', 'false').lower() in ('1', 'true', 'yes')
+# Same default as the ProfileSampleRate template parameter
+SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0.1'))
+
+# Entries in the summary
+TOP_FUNCTIONS = int(os.environ.get('PROFILE_TOP', '10'))
+TOP_ALLOCATIONS = 5
+
+# Profiled invocation in progress, boto3 calls are only recorded while there is one
+_current = None
+_lock = threading.Lock()
+
+def _operation_started(model, context, **kwargs):
+    if _current is not None:
+        # after-call-error is not given the operation, it is kept with the start
+        context['profile_started'] = (f'{model.service_model.service_name}.{model.name}', time.perf_counter())
+
+def _operation_finished(context, http_response=None, parsed=None, exception=None, **kwargs):
+    started = context.pop('profile_started', None)
+    if _current is None or started is None:
+        return
+    name, started = started
+    elapsed = time.perf_counter() - started
+    failed = exception is not None or (http_response is not None and http_response.status_code >= 400)
+    retries = ((parsed or {}).get('ResponseMetadata') or {}).get('RetryAttempts', 0)
+
+    with _lock:
+        call = _current.setdefault(name, {'calls': 0, 'seconds': 0.0, 'slowest': 0.0, 'errors': 0, 'retries': 0})
+        call['calls'] += 1
+        call['seconds'] += elapsed
+        call['slowest'] = max(call['slowest'], elapsed)
+        call['errors'] += failed
+        call['retries'] += retries
+
+def _register_hooks():
+    import boto3
+
+    if boto3.DEFAULT_SESSION is None:
+        boto3.setup_default_session()
+    events = boto3.DEFAULT_SESSION.events
+    events.register('before-call', _operation_started, unique_id='profiling-started')
+    events.register('after-call', _operation_finished, unique_id='profiling-finished')
+    events.register('after-call-error', _operation_finished, unique_id='profiling-failed')
+
+if ENABLED:
+    _register_hooks()
+
+def _location(filename, line, function=None):
+    """file:line[:function] with the last two path components, builtins by name only"""
+    if filename == '~':
+        return function
+    location = f"{'/'.join(filename.split(os.sep)[-2:])}:{line}"
+    return f'{location}:{function}' if function else location
+
+def _top_functions(profiler):
+    import pstats
+
+    rows = sorted(pstats.Stats(profiler).stats.items(), key=lambda row: row[1][2], reverse=True)
+    return [
+        {'function': _location(*key), 'calls': calls, 'ms': round(own * 1000, 1), 'cumulativeMs': round(cumulative * 1000, 1)}
+        for key, (_, calls, own, cumulative, _) in rows[:TOP_FUNCTIONS]
+    ]
+
+def _memory():
+    import resource
+    import tracemalloc
+
+    _, peak = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+    ])
+    # ru_maxrss is in KB on Linux
+    return {
+        'peakKB': peak // 1024,
+        'maxRssMB': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // 1024,
+        'sites': [
+            {'site': _location(stat.traceback[0].filename, stat.traceback[0].lineno), 'KB': stat.size // 1024, 'blocks': stat.count}
+            for stat in snapshot.statistics('lineno')[:TOP_ALLOCATIONS]
+        ]
+    }
+
+def _run_profiled(handler, event, context):
+    import cProfile
+    import json
+    import tracemalloc
+
+    global _current
+
+    calls = _current = {}
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active (e.g. a debugger), go without function timings
+        profiler = None
+    owns_tracing = not tracemalloc.is_tracing()
+    if owns_tracing:
+        tracemalloc.start()
+    else:
+        tracemalloc.reset_peak()
+
+    error = None
+    started = time.perf_counter()
+    cpu_started = time.process_time()
+    try:
+        return handler(event, context)
+    except Exception as e:
+        error = type(e).__name__
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        cpu = time.process_time() - cpu_started
+        if profiler:
+            profiler.disable()
+        _current = None
+        memory = _memory()
+        if owns_tracing:
+            tracemalloc.stop()
+
+        summary = {
+            'handler': getattr(context, 'function_name', None) or handler.__module__,
+            'durationMs': round(duration * 1000, 1),
+            'cpuMs': round(cpu * 1000, 1),
+            'awsMs': round(sum(call['seconds'] for call in calls.values()) * 1000, 1),
+            'functions': _top_functions(profiler) if profiler else [],
+            'memory': memory,
+            'aws': {
+                name: {
+                    'calls': call['calls'],
+                    'ms': round(call['seconds'] * 1000, 1),
+                    'maxMs': round(call['slowest'] * 1000, 1),
+                    'errors': call['errors'],
+                    'retries': call['retries']
+                }
+                for name, call in sorted(calls.items(), key=lambda item: item[1]['seconds'], reverse=True)
+            }
+        }
+        if error:
+            summary['error'] = error
+        print('PROFILE ' + json.dumps(summary, separators=(',', ':')))
+
+def profiled(handler):
+    """Profile a sample of the handler's invocations when PROFILE_HANDLERS is on, see the module docstring"""
+    if not ENABLED:
+        return handler
+
+    import functools
+    import random
+
+    @functools.wraps(handler)
+    def wrapper(event, context):
+        if random.random() >= SAMPLE_RATE:
+            return handler(event, context)
+        return _run_profiled(handler, event, context)
+
+    return wrapper
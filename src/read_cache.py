@@ -0,0 +1,120 @@
+"""Size-bounded in-process read cache for the API handler.
+
+Entries live in the Lambda container between requests. Each one is fresh for a
+TTL, after which it is stale: the caller revalidates it by comparing the
+version it was stored with (the item's ItemVersion, see src/pipeline.py) with
+the current one, a small projected get_item instead of reading the whole item
+again, and either renews it or replaces it. The least recently used entries are
+evicted once the estimated size of all entries exceeds max_bytes.
+
+A Lambda container serves one request at a time, so there is no locking.
+"""
+import sys
+import time
+from collections import OrderedDict
+
+# Estimated overhead of an entry (its key, Entry and OrderedDict slot)
+ENTRY_OVERHEAD = 200
+
+def estimate_size(value):
+    """Memory footprint of a JSON-like value, sys.getsizeof of every container and leaf.
+
+    getsizeof counts the 1, 2 or 4 bytes per character a str takes depending on
+    its widest character, the slots of dicts and lists, and Decimals.
+    """
+    size = sys.getsizeof(value)
+    if isinstance(value, dict):
+        size += sum(estimate_size(k) + estimate_size(v) for k, v in value.items())
+    elif isinstance(value, (list, tuple, set)):
+        size += sum(estimate_size(v) for v in value)
+    return size
+
+class Entry:
+    __slots__ = ('value', 'version', 'size', 'ttl', 'expires')
+
+    def __init__(self, value, version, size, ttl, expires):
+        self.value = value
+        self.version = version
+        self.size = size
+        self.ttl = ttl
+        self.expires = expires
+
+class ReadCache:
+    def __init__(self, max_bytes, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.size = 0
+        self.counters = {'hits': 0, 'misses': 0, 'revalidated': 0, 'stale': 0, 'evictions': 0}
+
+    def get(self, key):
+        """Return the value if it is fresh, None otherwise (counted as a miss)"""
+        entry = self.entries.get(key)
+        if entry is None or entry.expires <= self.clock():
+            self.counters['misses'] += 1
+            return None
+        self.entries.move_to_end(key)
+        self.counters['hits'] += 1
+        return entry.value
+
+    def get_or_revalidate(self, key, current_version):
+        """Return the value if it is fresh, or stale but still at the current version.
+
+        current_version is a callable that looks up the version the entry should
+        have, it is only called for stale entries. Returns (value, state) with state
+        'hit', 'revalidated' or 'miss' (value None).
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            self.counters['misses'] += 1
+            return None, 'miss'
+
+        if entry.expires > self.clock():
+            self.entries.move_to_end(key)
+            self.counters['hits'] += 1
+            return entry.value, 'hit'
+
+        if entry.version is not None and current_version() == entry.version:
+            entry.expires = self.clock() + entry.ttl
+            self.entries.move_to_end(key)
+            self.counters['revalidated'] += 1
+            return entry.value, 'revalidated'
+
+        self.counters['stale'] += 1
+        self.counters['misses'] += 1
+        self.invalidate(key)
+        return None, 'miss'
+
+    def put(self, key, value, ttl, version=None, size=None):
+        """Store a value for ttl seconds, values larger than the whole cache are not stored"""
+        size = (estimate_size(value) if size is None else size) + ENTRY_OVERHEAD
+        self.invalidate(key)
+        if size > self.max_bytes:
+            return
+
+        self.entries[key] = Entry(value, version, size, ttl, self.clock() + ttl)
+        self.size += size
+        while self.size > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= evicted.size
+            self.counters['evictions'] += 1
+
+    def invalidate(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry.size
+
+    def invalidate_prefix(self, prefix):
+        """Drop all entries whose key (a tuple) starts with prefix"""
+        for key in [key for key in self.entries if key[:len(prefix)] == prefix]:
+            self.invalidate(key)
+
+    def stats(self):
+        lookups = self.counters['hits'] + self.counters['revalidated'] + self.counters['misses']
+        return {
+            **self.counters,
+            'hitRate': (self.counters['hits'] + self.counters['revalidated']) / lookups if lookups else 0.0,
+            'entries': len(self.entries),
+            'bytes': self.size,
+            'maxBytes': self.max_bytes
+        }
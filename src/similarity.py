@@ -0,0 +1,216 @@
+"""Near-duplicate detection with MinHash signatures and an LSH band index.
+
+A signature is 128 32-bit minimums over the hashed 5-word shingles of a text,
+computed with one-permutation hashing: every shingle is hashed once and lands
+in one of the 128 bins, empty bins borrow from their neighbour. The fraction of
+equal positions in two signatures estimates the Jaccard similarity of the texts.
+
+Signatures are stored as 512 bytes in the item's MinHash attribute. For lookups
+they are cut into 32 bands of 4 rows; each band is hashed to a key of the
+similarity index table, so documents that share any band are candidates. Two
+texts with Jaccard 0.8 share a band with probability 1 - (1 - 0.8^4)^32 > 0.999,
+texts with Jaccard 0.3 with 0.23. Only candidates are compared, so a lookup
+costs one Query per band however many documents are indexed.
+"""
+import hashlib
+import re
+import sys
+import time
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+PERMUTATIONS = 128
+BANDS = 32
+ROWS = PERMUTATIONS // BANDS
+SHINGLE_WORDS = 5
+
+# Each shingle hash picks a bin with its low bits and competes there with the rest
+BIN_BITS = 7
+VALUE_MASK = 0xFFFFFFFF
+EMPTY = VALUE_MASK
+
+WORD_PATTERN = re.compile(r'\w+')
+
+# Attempts at reading back unprocessed keys of a batch_get_item
+MAX_RETRIES = 8
+
+def shingle_hashes(text):
+    """Yield a 64-bit hash for every run of SHINGLE_WORDS words, after normalizing case and punctuation"""
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_WORDS:
+        words = [' '.join(words)] if words else []
+        width = 1
+    else:
+        width = SHINGLE_WORDS
+
+    for start in range(len(words) - width + 1):
+        digest = hashlib.blake2b(' '.join(words[start:start + width]).encode('utf-8'), digest_size=8).digest()
+        yield int.from_bytes(digest, 'little')
+
+def signature(text):
+    """Return the MinHash signature of a text as an array of 32-bit values, or None for empty text"""
+    minimums = array('I', [EMPTY]) * PERMUTATIONS
+    found = False
+    for value in shingle_hashes(text):
+        index = value & (PERMUTATIONS - 1)
+        value = (value >> BIN_BITS) & VALUE_MASK
+        if value < minimums[index]:
+            minimums[index] = value
+            found = True
+
+    if not found:
+        return None
+
+    # Densify: an empty bin takes the next filled bin's value, offset by the
+    # distance so bins borrowing from the same neighbour do not all agree
+    filled = [index for index in range(PERMUTATIONS) if minimums[index] != EMPTY]
+    if len(filled) < PERMUTATIONS:
+        donor = filled[0] + PERMUTATIONS
+        for index in range(PERMUTATIONS - 1, -1, -1):
+            if minimums[index] != EMPTY:
+                donor = index
+            else:
+                distance = (donor - index) % PERMUTATIONS
+                minimums[index] = (minimums[donor % PERMUTATIONS] + distance * 0x9E3779B1) & VALUE_MASK
+    return minimums
+
+def to_bytes(minimums):
+    """Compact little-endian encoding stored in DynamoDB"""
+    if sys.byteorder != 'little':
+        minimums = array('I', minimums)
+        minimums.byteswap()
+    return minimums.tobytes()
+
+def from_bytes(data):
+    minimums = array('I')
+    minimums.frombytes(bytes(data))
+    if sys.byteorder != 'little':
+        minimums.byteswap()
+    return minimums
+
+def similarity(first, second):
+    """Estimated Jaccard similarity of the texts behind two signatures"""
+    return sum(1 for a, b in zip(first, second) if a == b) / PERMUTATIONS
+
+def band_hashes(minimums):
+    """Return a 64-bit hash per band of a signature"""
+    data = to_bytes(minimums)
+    width = ROWS * 4
+    return [
+        int.from_bytes(hashlib.blake2b(data[band * width:(band + 1) * width], digest_size=8).digest(), 'little')
+        for band in range(BANDS)
+    ]
+
+def band_keys(minimums):
+    """Partition keys of the similarity index for a signature, the band number keeps bands apart"""
+    return [f'{band:02d}:{value:016x}' for band, value in enumerate(band_hashes(minimums))]
+
+def candidates(index_table, bucket, minimums):
+    """Documents that share at least one band with a signature, as {name: [band keys they share]}"""
+    def query(band_key):
+        names = set()
+        kwargs = {
+            'KeyConditionExpression': 'Band = :band',
+            'ExpressionAttributeValues': {':band': band_key},
+            'ProjectionExpression': 'Document'
+        }
+        while True:
+            response = index_table.query(**kwargs)
+            for item in response['Items']:
+                document_bucket, name = item['Document'].split('/', 1)
+                if document_bucket == bucket:
+                    names.add(name)
+            if 'LastEvaluatedKey' not in response:
+                return band_key, names
+            kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    found = {}
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for band_key, names in executor.map(query, band_keys(minimums)):
+            for name in names:
+                found.setdefault(name, []).append(band_key)
+    return found
+
+def find_similar(dynamodb, table, index_table, bucket, name, minimums, threshold):
+    """Return [(name, similarity)] of indexed documents at least threshold similar, best first.
+
+    Index entries of documents that no longer exist are removed on the way.
+    Candidates still unread after MAX_RETRIES throttled attempts are left out.
+    """
+    names = candidates(index_table, bucket, minimums)
+    names.pop(name, None)
+    if not names:
+        return []
+
+    signatures = {}
+    unread = set()
+    keys = [{'Name': candidate, 'Bucket': bucket} for candidate in names]
+    for start in range(0, len(keys), 100):
+        request = {table.name: {'Keys': keys[start:start + 100], 'ProjectionExpression': '#n, MinHash',
+                                'ExpressionAttributeNames': {'#n': 'Name'}}}
+        for attempt in range(MAX_RETRIES):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(table.name, []):
+                if 'MinHash' in item:
+                    signatures[item['Name']] = from_bytes(item['MinHash'].value)
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+            time.sleep(min(0.05 * 2 ** attempt, 5))
+        if request:
+            unread.update(key['Name'] for key in request[table.name]['Keys'])
+
+    # Unread candidates may well exist, only missing ones are stale
+    stale = set(names) - set(signatures) - unread
+    if stale:
+        with index_table.batch_writer() as writer:
+            for stale_name in stale:
+                for band_key in names[stale_name]:
+                    writer.delete_item(Key={'Band': band_key, 'Document': f'{bucket}/{stale_name}'})
+
+    scored = [(candidate, similarity(minimums, other)) for candidate, other in signatures.items()]
+    return sorted([match for match in scored if match[1] >= threshold], key=lambda match: -match[1])
+
+def update_index(index_table, bucket, name, minimums, previous=None):
+    """Index a document's bands, removing the bands of its previous signature that changed"""
+    document = f'{bucket}/{name}'
+    keys = band_keys(minimums) if minimums is not None else []
+    old_keys = band_keys(previous) if previous is not None else []
+
+    with index_table.batch_writer() as writer:
+        for band_key in set(old_keys) - set(keys):
+            writer.delete_item(Key={'Band': band_key, 'Document': document})
+        for band_key in set(keys) - set(old_keys):
+            writer.put_item(Item={'Band': band_key, 'Document': document})
+
+def index_document(dynamodb, table, index_table, bucket, name, text, threshold, update_item=None):
+    """Sign a document's text, flag it as a duplicate of the most similar indexed one and index it.
+
+    Sets MinHash, and DuplicateOf/Similarity when a document at least threshold
+    similar exists. update_item replaces table.update_item, e.g. to add a condition.
+    Returns the name of that document or None.
+    """
+    minimums = signature(text)
+    matches = find_similar(dynamodb, table, index_table, bucket, name, minimums, threshold) if minimums else []
+
+    if matches:
+        duplicate_of, score = matches[0]
+        update = 'SET MinHash = :minhash, DuplicateOf = :duplicate, Similarity = :similarity'
+        values = {':minhash': to_bytes(minimums), ':duplicate': duplicate_of, ':similarity': Decimal(str(score))}
+    elif minimums:
+        duplicate_of = None
+        update = 'SET MinHash = :minhash REMOVE DuplicateOf, Similarity'
+        values = {':minhash': to_bytes(minimums)}
+    else:
+        duplicate_of = None
+        update = 'REMOVE MinHash, DuplicateOf, Similarity'
+        values = None
+
+    kwargs = {'Key': {'Name': name, 'Bucket': bucket}, 'UpdateExpression': update, 'ReturnValues': 'UPDATED_OLD'}
+    if values:
+        kwargs['ExpressionAttributeValues'] = values
+    previous = (update_item or table.update_item)(**kwargs).get('Attributes', {}).get('MinHash')
+
+    update_index(index_table, bucket, name, minimums, from_bytes(previous.value) if previous else None)
+    return duplicate_of
@@ -0,0 +1,159 @@
+"""Local extractive summarizer, an in-process alternative to Comprehend key phrases.
+
+The text is tokenized once into an array of term ids with sentence boundaries,
+which keeps large documents small in memory; the scoring itself is plain Python
+loops over it. Terms are weighted by TF-IDF, treating each sentence as a
+document. Sentences are scored by the weight of the terms they contain, and key
+phrases (runs of non-stopwords) by the weight of their terms and of the
+sentences they appear in. No service call, no model files, only the standard
+library.
+"""
+import math
+import re
+from array import array
+from collections import Counter
+
+TOKEN_PATTERN = re.compile(r"[A-Za-z][A-Za-z0-9'\-]*|[0-9][0-9.,]*")
+SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+|\n\s*\n|\n(?=[A-Z\-\*])')
+
+# Code and the tokens of commands, paths and URLs are no key phrases. Code blocks become a
+# paragraph break, Markdown links keep their text, other such tokens are blanked out:
+# anything with a path, variable, assignment or markup character, command line flags,
+# and names with a file extension or module path (src/x.py, os.environ, e.g.)
+CODE_BLOCK = re.compile(r'^[ \t]*(```|~~~).*?(?:^[ \t]*\1[^\n]*$|\Z)', re.M | re.S)
+INLINE_CODE = re.compile(r'`[^`\n]*`')
+MARKDOWN_LINK = re.compile(r'\[([^\]\n]*)\]\([^)\s]*\)')
+MACHINE_TOKEN = re.compile(r'(?<!\S)(?:\S*[/\\$=<>{}|_@]\S*|--?[A-Za-z]\S*|\S*[a-z0-9]\.[a-z]\S*)')
+
+STOPWORDS = frozenset('''
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each either else etc few for from further
+had has have having he her here hers herself him himself his how however i if in into is it its itself
+just let me more most my myself no nor not now of off on once only or other our ours ourselves out over
+own per same she should so some such than that the their theirs them themselves then there these they
+this those through thus to too under until up upon us very via was we were what when where which while
+who whom whose why will with within without would yet you your yours yourself yourselves
+'''.split())
+
+MAX_PHRASE_WORDS = 4
+
+def prose(text):
+    """The text without code, URLs and command line tokens"""
+    text = CODE_BLOCK.sub('\n\n', text)
+    text = INLINE_CODE.sub(' ', text)
+    text = MARKDOWN_LINK.sub(r'\1', text)
+    return MACHINE_TOKEN.sub(' ', text)
+
+def tokenize(text):
+    """Split the prose of a text into sentences of lowercase tokens.
+
+    Returns (vocabulary, token_ids, sentence_starts, original_tokens): token_ids
+    is an array of ids into vocabulary, sentence_starts the offsets where each
+    sentence begins in it.
+    """
+    vocabulary = {}
+    token_ids = array('I')
+    sentence_starts = array('I')
+    original_tokens = []
+
+    for sentence in SENTENCE_END.split(prose(text)):
+        tokens = TOKEN_PATTERN.findall(sentence)
+        if not tokens:
+            continue
+        sentence_starts.append(len(token_ids))
+        for token in tokens:
+            token_ids.append(vocabulary.setdefault(token.lower(), len(vocabulary)))
+        original_tokens.extend(tokens)
+
+    return vocabulary, token_ids, sentence_starts, original_tokens
+
+def term_weights(vocabulary, token_ids, sentence_starts):
+    """TF-IDF weight per term id, with sentences as the documents"""
+    terms = list(vocabulary)
+    stop = [term in STOPWORDS or len(term) < 3 or not term[0].isalpha() for term in terms]
+
+    term_frequency = Counter(token_ids)
+    document_frequency = Counter()
+    bounds = list(sentence_starts) + [len(token_ids)]
+    for start, end in zip(bounds, bounds[1:]):
+        document_frequency.update(set(token_ids[start:end]))
+
+    sentence_count = len(sentence_starts)
+    weights = array('d', bytes(8 * len(terms)))
+    for term_id, frequency in term_frequency.items():
+        if not stop[term_id]:
+            idf = math.log((1 + sentence_count) / (1 + document_frequency[term_id])) + 1
+            weights[term_id] = (1 + math.log(frequency)) * idf
+    return weights
+
+def sentence_scores(token_ids, sentence_starts, weights):
+    """Score each sentence by the weight of its distinct terms, damped by its length"""
+    bounds = list(sentence_starts) + [len(token_ids)]
+    scores = array('d')
+    for start, end in zip(bounds, bounds[1:]):
+        distinct = set(token_ids[start:end])
+        scores.append(sum(weights[term_id] for term_id in distinct) / math.sqrt(1 + len(distinct)))
+
+    top = max(scores, default=0) or 1
+    return array('d', (score / top for score in scores))
+
+def key_phrases(text, max_phrases=15):
+    """Return the highest scoring key phrases of a text, in document order"""
+    vocabulary, token_ids, sentence_starts, original_tokens = tokenize(text)
+    if not token_ids:
+        return []
+
+    weights = term_weights(vocabulary, token_ids, sentence_starts)
+    sentence_weight = sentence_scores(token_ids, sentence_starts, weights)
+
+    # Candidate phrases are runs of weighted terms within a sentence
+    candidates = {}
+    bounds = list(sentence_starts) + [len(token_ids)]
+    for sentence, (start, end) in enumerate(zip(bounds, bounds[1:])):
+        run_start = None
+        for position in range(start, end + 1):
+            in_phrase = position < end and weights[token_ids[position]] > 0
+            if in_phrase and run_start is None:
+                run_start = position
+            elif not in_phrase and run_start is not None:
+                # Long runs are split into phrases of at most MAX_PHRASE_WORDS
+                for phrase_start in range(run_start, position, MAX_PHRASE_WORDS):
+                    phrase_end = min(phrase_start + MAX_PHRASE_WORDS, position)
+                    phrase = tuple(token_ids[phrase_start:phrase_end])
+                    score = sum(weights[term_id] for term_id in phrase) * (1 + sentence_weight[sentence])
+                    best = candidates.get(phrase)
+                    if best is None:
+                        candidates[phrase] = [score, phrase_start, phrase_end]
+                    else:
+                        best[0] = max(best[0], score)
+                run_start = None
+
+    ranked = sorted(candidates.items(), key=lambda item: (-item[1][0], item[1][1]))
+
+    # Skip phrases whose terms are all covered by a better phrase already
+    chosen = []
+    covered = set()
+    for phrase, (score, phrase_start, phrase_end) in ranked:
+        if set(phrase) <= covered:
+            continue
+        chosen.append((phrase_start, ' '.join(original_tokens[phrase_start:phrase_end])))
+        covered.update(phrase)
+        if len(chosen) == max_phrases:
+            break
+
+    return [phrase for _, phrase in sorted(chosen)]
+
+def stopword_ratio(text, sample_tokens=2000):
+    """Share of English stopwords among the first tokens, a cheap check for English text"""
+    tokens = TOKEN_PATTERN.findall(text[:sample_tokens * 12])[:sample_tokens]
+    if not tokens:
+        return 0.0
+    return sum(1 for token in tokens if token.lower() in STOPWORDS) / len(tokens)
+
+def summarize(text, max_words=15):
+    """Comma separated key phrases, cut to max_words like the Comprehend summaries"""
+    summary = ', '.join(key_phrases(text))
+    words = summary.split()
+    if len(words) > max_words:
+        summary = ' '.join(words[:max_words])
+    return summary